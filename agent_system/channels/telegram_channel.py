@@ -1,15 +1,147 @@
 import os
 import time
 import threading
+import collections
+import functools
 import re
 import html
+import tempfile
 import requests
+from concurrent.futures import Future, ThreadPoolExecutor
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import Union, Optional, List, Dict, Any
+from typing import Union, Optional, List, Dict, Any, BinaryIO
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from agent_system.core.channel import Channel, FileAttachment
 from agent_system.utils import logger
 
+# Patterns used by _format_markdown, compiled once at import time
+_CODE_BLOCK_RE = re.compile(r'```(.*?)```', re.DOTALL)
+_INLINE_CODE_RE = re.compile(r'`(.*?)`')
+_MD_LINK_RE = re.compile(r'\[(.*?)\]\((.*?)\)')
+_HEADER_RE = re.compile(r'^(#{1,6})\s+(.*)$', re.MULTILINE)
+_HEADER_MARKUP_RE = re.compile(r'[\*_]')
+_BOLD_STAR_RE = re.compile(r'\*\*([^\s\*](?:.*?[^\s\*])?)\*\*')
+_BOLD_UNDER_RE = re.compile(r'\_\_([^\s\_](?:.*?[^\s\_])?)\_\_')
+_ITALIC_STAR_RE = re.compile(r'(?<!\*)\*([^\s\*](?:.*?[^\s\*])?)\*(?!\*)')
+_ITALIC_UNDER_RE = re.compile(r'(?<!\_)\_([^\s\_](?:.*?[^\s\_])?)\_(?!\_)')
+_URL_PLACEHOLDER_RE = re.compile(r'§url(\d+)§')
+_LINK_RESTORE_RE = re.compile(r'\[(.*?)\]\((§url\d+§)\)')
+_PLACEHOLDER_RE = re.compile(r'§(?:pre|code)(\d+)§')
+_LIST_RE = re.compile(r'^\s*[\*\-]\s+(.*)$', re.MULTILINE)
+
+# HTML tags emitted by _format_markdown that _split_message must keep balanced
+# Group 1: is_closing, Group 2: tag_name, Group 3: href_content
+_TAG_RE = re.compile(r'<(/?)(b|i|u|s|code|pre|a)(?:\s+href="([^"]*)")?>')
+
+# Telegram bot command names: lowercase English letters, digits and underscores
+_COMMAND_RE = re.compile(r'^[a-z0-9_]+$')
+
+def _format_markdown_uncached(text: str) -> str:
+    """Converts basic Markdown to Telegram-compatible HTML, avoiding interleaved tags."""
+    
+    # 1. Handle code blocks and inline code FIRST using opaque placeholders
+    # This protects their content from being escaped or modified by other rules
+    placeholders = []
+    
+    def save_placeholder(tag, content):
+        idx = len(placeholders)
+        # Use unique tokens that won't be matched by bold/italic regex (no * or _)
+        placeholder = f"§{tag}{idx}§"
+        # Escape HTML inside code
+        escaped_content = html.escape(content)
+        if tag == "pre":
+            placeholders.append(f"<pre>{escaped_content}</pre>")
+        else:
+            placeholders.append(f"<code>{escaped_content}</code>")
+        return placeholder
+
+    # Multi-line code blocks
+    text = _CODE_BLOCK_RE.sub(lambda m: save_placeholder("pre", m.group(1)), text)
+    # Inline code
+    text = _INLINE_CODE_RE.sub(lambda m: save_placeholder("code", m.group(1)), text)
+    
+    # 2. Protect URLs in Markdown links before escaping or formatting
+    # This prevents underscores in URLs from being turned into <i> tags
+    def save_url_placeholder(match):
+        idx = len(placeholders)
+        placeholder = f"§url{idx}§"
+        placeholders.append(match.group(2))
+        return f"[{match.group(1)}]({placeholder})"
+        
+    text = _MD_LINK_RE.sub(save_url_placeholder, text)
+
+    # 3. Escape HTML special characters for the rest of the text
+    # Code and URLs were already swapped out for short §...§ tokens above, so this
+    # single pass never rescans their contents; splitting around the tokens would only add work.
+    text = html.escape(text)
+
+    # 4. Handle Headers (convert to bold)
+    def clean_header(match):
+        content = match.group(2)
+        # Remove MD formatting from headers to prevent nesting complications
+        content = _HEADER_MARKUP_RE.sub('', content)
+        return f"<b>{content}</b>"
+        
+    text = _HEADER_RE.sub(clean_header, text)
+
+    # 5. Bold: **text** or __text__ -> <b>text</b>
+    # Require that the first/last characters are not whitespace or the symbol itself 
+    # to prevent triple-symbol interleaving (e.g., ***triple*** matching ** then *)
+    text = _BOLD_STAR_RE.sub(r'<b>\1</b>', text)
+    text = _BOLD_UNDER_RE.sub(r'<b>\1</b>', text)
+
+    # 6. Italic: *text* or _text_ -> <i>text</i>
+    text = _ITALIC_STAR_RE.sub(r'<i>\1</i>', text)
+    text = _ITALIC_UNDER_RE.sub(r'<i>\1</i>', text)
+
+    # 7. Finalize Hyperlinks: [text](PLACEHOLDER) -> <a href="original_url">text</a>
+    # This converts the protected link structure to final HTML
+    def restore_link(match):
+        text_part = match.group(1)
+        placeholder = match.group(2)
+        # Find the original URL from placeholders
+        match_p = _URL_PLACEHOLDER_RE.match(placeholder)
+        if match_p:
+            url = placeholders[int(match_p.group(1))]
+            return f'<a href="{url}">{text_part}</a>'
+        return match.group(0) # Should not happen
+
+    text = _LINK_RESTORE_RE.sub(restore_link, text)
+
+    # 8. Unordered Lists: * item or - item -> • item
+    text = _LIST_RE.sub(r'• \1', text)
+
+    # 9. Restore Code/Pre placeholders in a single pass; URLs are handled in step 7
+    def restore_code(match):
+        idx = int(match.group(1))
+        # Leave look-alike tokens typed by the user untouched
+        return placeholders[idx] if idx < len(placeholders) else match.group(0)
+
+    text = _PLACEHOLDER_RE.sub(restore_code, text)
+
+    return text
+
+# Characters that can trigger any _format_markdown rule; text without them only needs escaping
+_MD_CHARS = frozenset("*_`[#-")
+
+# Formatting is a pure function of the text, so repeated strings (help, errors, status) are cached.
+# Very long texts bypass the cache to keep its memory bounded.
+_FORMAT_CACHE_MAX_TEXT = 8192
+_format_markdown_cached = functools.lru_cache(maxsize=512)(_format_markdown_uncached)
+
+
+def _json(resp: requests.Response) -> Any:
+    """Decodes a Bot API response body, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(resp.content)
+    return resp.json()
+
+
 class TelegramChannel(Channel):
     """Implementation of I/O via a Telegram Bot."""
     
@@ -18,10 +150,29 @@ class TelegramChannel(Channel):
         self.token = token or os.getenv("TELEGRAM_BOT_TOKEN")
         self.restricted_chat_id = restricted_chat_id or os.getenv("TELEGRAM_CHAT_ID")
         self.api_url = f"https://api.telegram.org/bot{self.token}"
+        # Fixed endpoints, built once instead of per request
+        self._get_updates_url = f"{self.api_url}/getUpdates"
+        self._getfile_url = f"{self.api_url}/getFile"
+        self._file_url_prefix = f"https://api.telegram.org/file/bot{self.token}/"
         self.offset = 0
+        # Updates fetched by the last getUpdates call that haven't been handed to the engine yet
+        self._update_queue = collections.deque()
+        # Telegram long-poll timeout; the HTTP read timeout must stay strictly above it
+        self._poll_timeout = 30
+        # (connect, read) timeouts for every other call, so no worker thread can hang on a dead socket
+        self._request_timeout = (10, 30)
+        self._upload_timeout = (10, 120)
+        # Timestamps of recent sends, shared with the activity thread (Telegram allows ~30 msg/s per bot)
+        self._bucket = collections.deque()
+        self._bucket_lock = threading.Lock()
+        self._max_sends_per_second = 28
         self.active_activity: Optional[str] = None
-        self.activity_thread: Optional[threading.Thread] = None
+        self._activity_cond = threading.Condition()
+        self._activity_worker: Optional[threading.Thread] = None
+        # Set whenever no activity is being shown
         self.stop_activity_event = threading.Event()
+        self.stop_activity_event.set()
+        self._send_pending = threading.Event()
         
         # Configure robust session with retries
         self.session = requests.Session()
@@ -32,9 +183,18 @@ class TelegramChannel(Channel):
             allowed_methods=["HEAD", "GET", "OPTIONS", "POST"],
             raise_on_status=False
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # The long poll, activity thread and outbound sends run concurrently,
+        # so keep enough pooled connections around to avoid re-handshaking TLS
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, pool_block=False, max_retries=retry_strategy)
         self.session.mount("https://", adapter)
         self.session.mount("http://", adapter)
+
+        # Dedicated session for file downloads so large transfers never borrow long-poll sockets
+        self.file_session = requests.Session()
+        file_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry_strategy)
+        self.file_session.mount("https://", file_adapter)
+        self.file_session.mount("http://", file_adapter)
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="telegram-getfile")
         
         if not self.token:
             raise ValueError("TELEGRAM_BOT_TOKEN must be provided or set in environment variables.")
@@ -45,299 +205,375 @@ class TelegramChannel(Channel):
         """Polls for updates and returns user input."""
         while True:
             try:
-                resp = self.session.get(f"{self.api_url}/getUpdates", params={"offset": self.offset, "timeout": 30}).json()
+                # Serve updates left over from the previous poll before asking for more
+                while self._update_queue:
+                    user_input = self._handle_update(self._update_queue.popleft())
+                    if user_input is not None:
+                        return user_input
+
+                resp = self.session.get(
+                    self._get_updates_url,
+                    params={"offset": self.offset, "timeout": self._poll_timeout},
+                    timeout=(10, self._poll_timeout + 5)
+                )
+                resp = _json(resp)
                 if resp.get("ok") and resp.get("result"):
-                    for update in resp["result"]:
-                        self.offset = update["update_id"] + 1
-                        
-                        if "message" not in update:
-                            continue
-                            
-                        message = update["message"]
-                        chat_id = str(message["chat"]["id"])
-                        
-                        # Security check: restrict to user if configured
-                        if self.restricted_chat_id and chat_id != str(self.restricted_chat_id):
-                            continue
-                            
-                        # Handle text input
-                        if "text" in message:
-                            return message["text"]
-                            
-                        caption = message.get("caption")
-                        
-                        # Handle file attachments
-                        if "document" in message:
-                            return self._process_document(message["document"], caption=caption)
-                        
-                        if "photo" in message:
-                            # Telegram sends multiple sizes, take the largest one
-                            return self._process_photo(message["photo"][-1], caption=caption)
-
-                        # Handle voice messages
-                        if "voice" in message:
-                            return self._process_voice(message["voice"], caption=caption)
-
-                        # Handle audio files
-                        if "audio" in message:
-                            return self._process_audio(message["audio"], caption=caption)
-
-                time.sleep(1) # Small delay to prevent tight loop if no updates
+                    updates = resp["result"]
+                    # Buffer the whole batch and acknowledge it once; the next poll confirms it
+                    self._update_queue.extend(updates)
+                    self.offset = updates[-1]["update_id"] + 1
+                # No sleep here: the long poll itself blocks until updates arrive
+            except requests.exceptions.ReadTimeout:
+                # Benign: the connection went quiet past the long-poll window, just re-poll
+                continue
             except Exception as e:
                 logger.error(f"Error getting input from Telegram: {e}")
-                time.sleep(5)
+                time.sleep(2)
 
-    def _process_document(self, doc: Dict[str, Any], caption: Optional[str] = None) -> FileAttachment:
-        file_id = doc["file_id"]
-        filename = doc.get("file_name", "telegram_file")
-        mime_type = doc.get("mime_type")
+    def _handle_update(self, update: Dict[str, Any]) -> Optional[Union[str, FileAttachment]]:
+        """Turns a single update into user input, or None if it should be ignored."""
+        if "message" not in update:
+            return None
+            
+        message = update["message"]
+        chat_id = str(message["chat"]["id"])
         
-        def getter():
-            file_resp = self.session.get(f"{self.api_url}/getFile", params={"file_id": file_id}).json()
-            if file_resp.get("ok"):
-                file_path = file_resp["result"]["file_path"]
-                download_url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
-                return self.session.get(download_url).content
-            return b""
+        # Security check: restrict to user if configured
+        if self.restricted_chat_id and chat_id != str(self.restricted_chat_id):
+            return None
+            
+        # Handle text input
+        if "text" in message:
+            return message["text"]
             
-        return FileAttachment(name=filename, content_getter=getter, mime_type=mime_type, caption=caption)
+        caption = message.get("caption")
+        
+        # Handle file attachments
+        if "document" in message:
+            return self._process_document(message["document"], caption=caption)
+        
+        if "photo" in message:
+            # Telegram sends multiple sizes, take the largest one
+            return self._process_photo(message["photo"][-1], caption=caption)
+
+        # Handle voice messages
+        if "voice" in message:
+            return self._process_voice(message["voice"], caption=caption)
+
+        # Handle audio files
+        if "audio" in message:
+            return self._process_audio(message["audio"], caption=caption)
+
+        return None
+
+    def _process_document(self, doc: Dict[str, Any], caption: Optional[str] = None) -> FileAttachment:
+        filename = doc.get("file_name", "telegram_file")
+        return self._build_attachment(doc, filename, doc.get("mime_type"), caption)
 
     def _process_photo(self, photo: Dict[str, Any], caption: Optional[str] = None) -> FileAttachment:
-        file_id = photo["file_id"]
         filename = f"photo_{int(time.time())}.jpg"
-        
-        def getter():
-            file_resp = self.session.get(f"{self.api_url}/getFile", params={"file_id": file_id}).json()
-            if file_resp.get("ok"):
-                file_path = file_resp["result"]["file_path"]
-                download_url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
-                return self.session.get(download_url).content
-            return b""
-            
-        return FileAttachment(name=filename, content_getter=getter, mime_type="image/jpeg", caption=caption)
+        return self._build_attachment(photo, filename, "image/jpeg", caption)
 
     def _process_voice(self, voice: Dict[str, Any], caption: Optional[str] = None) -> FileAttachment:
-        file_id = voice["file_id"]
         filename = f"voice_{int(time.time())}.ogg"
-        mime_type = voice.get("mime_type", "audio/ogg")
-        
-        def getter():
-            file_resp = self.session.get(f"{self.api_url}/getFile", params={"file_id": file_id}).json()
-            if file_resp.get("ok"):
-                file_path = file_resp["result"]["file_path"]
-                download_url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
-                return self.session.get(download_url).content
-            return b""
-            
-        return FileAttachment(name=filename, content_getter=getter, mime_type=mime_type, caption=caption)
+        return self._build_attachment(voice, filename, voice.get("mime_type", "audio/ogg"), caption)
 
     def _process_audio(self, audio: Dict[str, Any], caption: Optional[str] = None) -> FileAttachment:
-        file_id = audio["file_id"]
         # Use provided file_name or generate one
         filename = audio.get("file_name", f"audio_{int(time.time())}.mp3")
-        mime_type = audio.get("mime_type", "audio/mpeg")
-        
-        def getter():
-            file_resp = self.session.get(f"{self.api_url}/getFile", params={"file_id": file_id}).json()
-            if file_resp.get("ok"):
-                file_path = file_resp["result"]["file_path"]
-                download_url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
-                return self.session.get(download_url).content
-            return b""
-            
-        return FileAttachment(name=filename, content_getter=getter, mime_type=mime_type, caption=caption)
+        return self._build_attachment(audio, filename, audio.get("mime_type", "audio/mpeg"), caption)
+
+    def _build_attachment(self, file_info: Dict[str, Any], filename: str, mime_type: Optional[str],
+                          caption: Optional[str]) -> FileAttachment:
+        """Wraps a Telegram file object into a FileAttachment whose content is fetched lazily."""
+        url_future = self._prefetch_download_url(file_info)
+        return FileAttachment(
+            name=filename,
+            content_getter=functools.partial(self._download_file, url_future),
+            mime_type=mime_type,
+            caption=caption
+        )
+
+    def _download_file(self, url_future: Future) -> Union[bytes, BinaryIO]:
+        download_url = url_future.result()
+        if download_url:
+            return self._download(download_url)
+        return b""
+
+    def _prefetch_download_url(self, file_info: Dict[str, Any]) -> Future:
+        """Starts resolving a file's download URL now, so the getFile round trip
+        overlaps with whatever runs before the attachment is consumed."""
+        if file_info.get("file_path"):
+            future = Future()
+            future.set_result(self._file_url_prefix + file_info["file_path"])
+            return future
+        return self._prefetch_executor.submit(self._resolve_download_url, file_info["file_id"])
+
+    def _resolve_download_url(self, file_id: str) -> Optional[str]:
+        file_resp = _json(self.session.get(self._getfile_url, params={"file_id": file_id}, timeout=self._request_timeout))
+        if file_resp.get("ok"):
+            return self._file_url_prefix + file_resp["result"]["file_path"]
+        return None
+
+    def _download(self, download_url: str) -> BinaryIO:
+        """Streams a file into a spooled temporary file (kept in memory up to 1 MB, then on disk)."""
+        buf = tempfile.SpooledTemporaryFile(max_size=1_000_000)
+        with self.file_session.get(download_url, stream=True, timeout=(10, 120)) as resp:
+            for chunk in resp.iter_content(chunk_size=65536):
+                buf.write(chunk)
+        buf.seek(0)
+        return buf
 
     def send_output(self, text: str):
         """Sends a text message to the restricted chat ID, splitting long messages if needed."""
-        self.stop_activity()
-        if not self.restricted_chat_id:
-            logger.warning("No restricted_chat_id set. Cannot send output.")
-            return
+        # Keep the activity thread from firing a chat action that would race this send
+        self._send_pending.set()
+        try:
+            self.stop_activity()
+            if not self.restricted_chat_id:
+                logger.warning("No restricted_chat_id set. Cannot send output.")
+                return
 
-        formatted_text = self._format_markdown(text)
+            formatted_text = self._format_markdown(text)
         
-        # Telegram's maximum message length is 4096 characters.
-        MAX_LENGTH = 4000
+            # Telegram's maximum message length is 4096 characters.
+            MAX_LENGTH = 4000
         
-        if len(formatted_text) <= MAX_LENGTH:
-            messages = [formatted_text]
-        else:
-            messages = self._split_message(formatted_text, MAX_LENGTH)
+            if len(formatted_text) <= MAX_LENGTH:
+                messages = [formatted_text]
+            else:
+                messages = self._split_message(formatted_text, MAX_LENGTH)
 
-        for msg in messages:
-            try:
-                payload = {
-                    "chat_id": self.restricted_chat_id,
-                    "text": msg,
-                    "parse_mode": "HTML"
-                }
-                resp = self.session.post(f"{self.api_url}/sendMessage", json=payload)
-                resp.raise_for_status()
+            # Chunks go out one at a time on purpose: concurrent requests are not delivered
+            # in a guaranteed order, and a reply reassembled out of order is unreadable.
+            for msg in messages:
+                try:
+                    payload = {
+                        "chat_id": self.restricted_chat_id,
+                        "text": msg,
+                        "parse_mode": "HTML"
+                    }
+                    resp = self._rate_limited_post(f"{self.api_url}/sendMessage", json=payload, timeout=self._request_timeout)
+                    resp.raise_for_status()
                 
-                result = resp.json()
-                if not result.get("ok"):
-                    logger.error(f"Telegram API error (sendMessage): {result.get('description')}")
-            except Exception as e:
-                logger.error(f"Error sending message to Telegram: {e}")
-                if hasattr(e, 'response') and e.response is not None:
-                    try:
-                        logger.error(f"Telegram Response: {e.response.json()}")
-                    except:
-                        logger.error(f"Telegram Response Text: {e.response.text}")
+                    result = _json(resp)
+                    if not result.get("ok"):
+                        logger.error(f"Telegram API error (sendMessage): {result.get('description')}")
+                except Exception as e:
+                    logger.error(f"Error sending message to Telegram: {e}")
+                    if hasattr(e, 'response') and e.response is not None:
+                        try:
+                            logger.error(f"Telegram Response: {e.response.json()}")
+                        except:
+                            logger.error(f"Telegram Response Text: {e.response.text}")
+        finally:
+            self._send_pending.clear()
+
+    def _rate_limited_post(self, url: str, **kwargs) -> requests.Response:
+        """POSTs to the Bot API, waiting first if the bot-wide send rate would be exceeded."""
+        with self._bucket_lock:
+            now = time.monotonic()
+            while self._bucket and now - self._bucket[0] >= 1.0:
+                self._bucket.popleft()
+            if len(self._bucket) >= self._max_sends_per_second:
+                # Holding the lock while waiting keeps concurrent senders in order
+                time.sleep(1.0 - (now - self._bucket[0]))
+                self._bucket.popleft()
+            self._bucket.append(time.monotonic())
+        return self.session.post(url, **kwargs)
 
     def _split_message(self, text: str, max_length: int) -> List[str]:
-        """Splits message into chunks, ensuring HTML tags are balanced across chunks."""
+        """Splits message into chunks, ensuring HTML tags are balanced across chunks.
+
+        Tags are located once over the whole text and consumed in order as chunks
+        are emitted, so no chunk is rescanned and no split lands inside a tag.
+        """
         chunks = []
         current_pos = 0
         total_len = len(text)
         active_tags = [] # Format: [(tag, href), ...]
+        tag_events = list(_TAG_RE.finditer(text))
+        event_idx = 0
         
         while current_pos < total_len:
             # Prefix for this chunk: re-open tags from previous chunk
-            prefix = ""
-            for tag, href in active_tags:
-                if tag == 'a' and href:
-                    prefix += f'<a href="{href}">'
-                else:
-                    prefix += f"<{tag}>"
+            prefix = "".join(
+                f'<a href="{href}">' if tag == 'a' and href else f"<{tag}>"
+                for tag, href in active_tags
+            )
             
-            # Suffix for this chunk: close tags currently active
-            suffix = ""
-            for tag, _ in reversed(active_tags):
-                suffix += f"</{tag}>"
+            # Room needed to close tags currently active ("</" + tag + ">")
+            suffix_len = sum(len(tag) + 3 for tag, _ in active_tags)
             
             # Target length for NEW content in this chunk
             # available = max_length - prefix - suffix
-            chunk_max_content = max_length - len(prefix) - len(suffix)
+            chunk_max_content = max_length - len(prefix) - suffix_len
             if chunk_max_content < 500 and total_len - current_pos > 500:
                 # If prefix/suffix are too long, ensure we at least make progress
                 # 4000 is slightly below the 4096 absolute limit
                 chunk_max_content = 500
             
-            # Look for split point in text[current_pos : current_pos + chunk_max_content]
-            split_limit = min(current_pos + chunk_max_content, total_len)
-            split_at = split_limit
-            
-            if split_at < total_len:
-                # Try to find a good split point (newline or space)
-                newline_pos = text.rfind('\n', current_pos, split_at)
-                if newline_pos != -1 and newline_pos > current_pos + (chunk_max_content // 2):
-                    split_at = newline_pos + 1
-                else:
-                    space_pos = text.rfind(' ', current_pos, split_at)
-                    if space_pos != -1 and space_pos > current_pos + (chunk_max_content // 2):
-                        split_at = space_pos + 1
-            
-            raw_content = text[current_pos : split_at]
-            
-            # Update active_tags based on tags found in this raw_content
-            # Group 1: is_closing, Group 2: tag_name, Group 3: href_content
-            tag_regex = re.compile(r'<(/?)(b|i|u|s|code|pre|a)(?:\s+href="([^"]*)")?>')
-            for match in tag_regex.finditer(raw_content):
-                is_closing = match.group(1) == '/'
-                tag_name = match.group(2)
-                href = match.group(3)
-                if is_closing:
-                    if active_tags and active_tags[-1][0] == tag_name:
-                        active_tags.pop()
-                else:
-                    active_tags.append((tag_name, href))
-            
-            # Re-calculate suffix for the ACTUAL content (it might have balanced some tags)
-            actual_suffix = ""
-            for tag, _ in reversed(active_tags):
-                actual_suffix += f"</{tag}>"
+            while True:
+                split_at = self._find_split_point(text, current_pos, chunk_max_content)
+                chunk_tags = list(active_tags)
+                chunk_event_idx = event_idx
+                
+                # Update the open tags with those that fall inside this chunk
+                while chunk_event_idx < len(tag_events):
+                    match = tag_events[chunk_event_idx]
+                    if match.start() >= split_at:
+                        break
+                    if match.end() > split_at:
+                        # Never cut through a tag: end the chunk right before it
+                        if match.start() > current_pos:
+                            split_at = match.start()
+                            break
+                        split_at = match.end()
+                    
+                    is_closing = match.group(1) == '/'
+                    tag_name = match.group(2)
+                    href = match.group(3)
+                    if is_closing:
+                        if chunk_tags and chunk_tags[-1][0] == tag_name:
+                            chunk_tags.pop()
+                    else:
+                        chunk_tags.append((tag_name, href))
+                    chunk_event_idx += 1
                 
-            chunks.append(prefix + raw_content + actual_suffix)
+                # Close whatever is still open at the end of the ACTUAL content
+                suffix = "".join(f"</{tag}>" for tag, _ in reversed(chunk_tags))
+                
+                # Tags opened inside the chunk may push it over the limit; shrink and retry
+                overflow = len(prefix) + (split_at - current_pos) + len(suffix) - max_length
+                if overflow <= 0 or chunk_max_content - overflow < 500:
+                    break
+                chunk_max_content -= overflow
+            
+            chunks.append(prefix + text[current_pos:split_at] + suffix)
+            active_tags = chunk_tags
+            event_idx = chunk_event_idx
             current_pos = split_at
             
         return chunks
 
+    def _find_split_point(self, text: str, start: int, max_content: int) -> int:
+        """Returns the end of a chunk starting at `start`, preferring newline or space boundaries."""
+        split_at = min(start + max_content, len(text))
+        if split_at < len(text):
+            # Try to find a good split point (newline or space). Breaks in the first half of
+            # the window are rejected, so only the second half is searched. rfind is a C loop,
+            # which beats a hand-written single pass; the space scan only runs as a fallback.
+            lo = start + (max_content // 2) + 1
+            newline_pos = text.rfind('\n', lo, split_at)
+            if newline_pos != -1:
+                return newline_pos + 1
+            space_pos = text.rfind(' ', lo, split_at)
+            if space_pos != -1:
+                return space_pos + 1
+        return split_at
+
     def send_file(self, file_path: str, caption: Optional[str] = None):
         """Sends a file to the restricted chat ID."""
-        self.stop_activity()
-        if not self.restricted_chat_id:
-            logger.warning("No restricted_chat_id set. Cannot send file.")
-            return
-
+        # Keep the activity thread from firing a chat action that would race this send
+        self._send_pending.set()
         try:
-            filename = os.path.basename(file_path)
-            # Decide whether to use sendDocument or sendPhoto based on extension
-            is_photo = filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
-            is_voice = filename.lower().endswith(('.wav', '.ogg', '.mp3', '.m4a'))
+            self.stop_activity()
+            if not self.restricted_chat_id:
+                logger.warning("No restricted_chat_id set. Cannot send file.")
+                return
+
+            try:
+                filename = os.path.basename(file_path)
+                # Decide whether to use sendDocument or sendPhoto based on extension
+                is_photo = filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
+                is_voice = filename.lower().endswith(('.wav', '.ogg', '.mp3', '.m4a'))
             
-            if is_photo:
-                method = "sendPhoto"
-                file_key = "photo"
-            elif is_voice:
-                method = "sendVoice"
-                file_key = "voice"
-            else:
-                method = "sendDocument"
-                file_key = "document"
-
-            with open(file_path, "rb") as f:
-                files = {file_key: (filename, f)}
-                data = {"chat_id": self.restricted_chat_id}
-                if caption:
-                    # Strip headers and complex MD from captions as they are more restrictive
-                    formatted_caption = self._format_markdown(caption)
-                    data["caption"] = formatted_caption
-                    data["parse_mode"] = "HTML"
-                resp = self.session.post(f"{self.api_url}/{method}", data=data, files=files)
-                resp.raise_for_status()
+                if is_photo:
+                    method = "sendPhoto"
+                    file_key = "photo"
+                elif is_voice:
+                    method = "sendVoice"
+                    file_key = "voice"
+                else:
+                    method = "sendDocument"
+                    file_key = "document"
+
+                with open(file_path, "rb") as f:
+                    files = {file_key: (filename, f)}
+                    data = {"chat_id": self.restricted_chat_id}
+                    if caption:
+                        # Strip headers and complex MD from captions as they are more restrictive
+                        formatted_caption = self._format_markdown(caption)
+                        data["caption"] = formatted_caption
+                        data["parse_mode"] = "HTML"
+                    resp = self._rate_limited_post(f"{self.api_url}/{method}", data=data, files=files, timeout=self._upload_timeout)
+                    resp.raise_for_status()
                 
-                result = resp.json()
-                if not result.get("ok"):
-                    logger.error(f"Telegram API error ({method}): {result.get('description')}")
-        except Exception as e:
-            logger.error(f"Error sending file to Telegram: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    logger.error(f"Telegram Response: {e.response.json()}")
-                except:
-                    pass
+                    result = _json(resp)
+                    if not result.get("ok"):
+                        logger.error(f"Telegram API error ({method}): {result.get('description')}")
+            except Exception as e:
+                logger.error(f"Error sending file to Telegram: {e}")
+                if hasattr(e, 'response') and e.response is not None:
+                    try:
+                        logger.error(f"Telegram Response: {e.response.json()}")
+                    except:
+                        pass
+        finally:
+            self._send_pending.clear()
 
     def show_activity(self, action: str = "typing"):
         """Shows a periodic chat action in Telegram until stopped."""
         if not self.restricted_chat_id:
             return
 
-        if self.active_activity == action:
-            return
-
-        self.stop_activity()
-        self.active_activity = action
-        self.stop_activity_event.clear()
-        self.activity_thread = threading.Thread(target=self._activity_loop, args=(action,), daemon=True)
-        self.activity_thread.start()
+        with self._activity_cond:
+            if self.active_activity == action:
+                return
+            self.active_activity = action
+            self.stop_activity_event.clear()
+            if self._activity_worker is None:
+                self._activity_worker = threading.Thread(target=self._activity_loop, daemon=True)
+                self._activity_worker.start()
+            self._activity_cond.notify()
 
     def stop_activity(self):
         """Stops the current chat action."""
-        if self.active_activity:
-            self.stop_activity_event.set()
-            if self.activity_thread and self.activity_thread.is_alive():
-                # Wait briefly for the thread to exit to avoid overlapping threads
-                self.activity_thread.join(timeout=1.0)
-            self.active_activity = None
-            self.activity_thread = None
-
-    def _activity_loop(self, action: str):
-        """Sends chat action periodically."""
-        while not self.stop_activity_event.is_set():
-            try:
-                payload = {
-                    "chat_id": self.restricted_chat_id,
-                    "action": action
-                }
-                resp = self.session.post(f"{self.api_url}/sendChatAction", json=payload)
-                resp.raise_for_status()
-                # Telegram chat actions expire after ~5 seconds
-                self.stop_activity_event.wait(4)
-            except Exception as e:
-                # Log but continue the loop unless it's a persistent failure
-                logger.debug(f"Error sending periodic chat action to Telegram: {e}")
-                self.stop_activity_event.wait(2)
+        with self._activity_cond:
+            if self.active_activity:
+                self.active_activity = None
+                self.stop_activity_event.set()
+                self._activity_cond.notify()
+
+    def _activity_loop(self):
+        """Sends the current chat action periodically; one long-lived worker serves every activity."""
+        while True:
+            with self._activity_cond:
+                while self.active_activity is None:
+                    self._activity_cond.wait()
+                action = self.active_activity
+
+            # Telegram chat actions expire after ~5 seconds
+            delay = 4
+            if self._send_pending.is_set():
+                # The outgoing message ends the action anyway; don't spend a request on it
+                delay = 0.5
+            else:
+                try:
+                    payload = {
+                        "chat_id": self.restricted_chat_id,
+                        "action": action
+                    }
+                    resp = self._rate_limited_post(f"{self.api_url}/sendChatAction", json=payload, timeout=self._request_timeout)
+                    resp.raise_for_status()
+                except Exception as e:
+                    # Log but keep going unless the activity is stopped
+                    logger.debug(f"Error sending periodic chat action to Telegram: {e}")
+                    delay = 2
+
+            # Wait for the next ping, waking early if the action changes or stops
+            with self._activity_cond:
+                self._activity_cond.wait_for(lambda: self.active_activity != action, timeout=delay)
 
     def send_status(self, text: str):
         """Telegram suppresses technical status updates to avoid chat clutter."""
@@ -350,7 +586,7 @@ class TelegramChannel(Channel):
             # Telegram commands must not start with / for setMyCommands
             # and must only contain lowercase English letters, digits and underscores.
             cmd_text = cmd.lstrip("/").lower()
-            if not re.match(r'^[a-z0-9_]+$', cmd_text):
+            if not _COMMAND_RE.match(cmd_text):
                 continue
                 
             tg_commands.append({
@@ -361,92 +597,39 @@ class TelegramChannel(Channel):
         if not tg_commands:
             return
 
+        # Skip the update when this bot already has exactly these commands. Asking Telegram
+        # rather than keeping a local record also sees edits made through BotFather.
+        if self._registered_commands() == tg_commands:
+            logger.debug("[Telegram] Commands unchanged, skipping setMyCommands.")
+            return
+
         try:
-            resp = self.session.post(f"{self.api_url}/setMyCommands", json={"commands": tg_commands})
+            resp = self.session.post(f"{self.api_url}/setMyCommands", json={"commands": tg_commands}, timeout=self._request_timeout)
             resp.raise_for_status()
-            if resp.json().get("ok"):
+            result = _json(resp)
+            if result.get("ok"):
                 logger.info(f"[Telegram] Successfully registered {len(tg_commands)} commands.")
             else:
-                logger.error(f"[Telegram] Failed to register commands: {resp.json().get('description')}")
+                logger.error(f"[Telegram] Failed to register commands: {result.get('description')}")
         except Exception as e:
             logger.error(f"[Telegram] Error calling setMyCommands: {e}")
 
+    def _registered_commands(self) -> Optional[List[Dict[str, str]]]:
+        """Returns the bot's current command list via getMyCommands, or None if unknown."""
+        try:
+            resp = self.session.get(f"{self.api_url}/getMyCommands", timeout=self._request_timeout)
+            resp.raise_for_status()
+            result = _json(resp)
+        except Exception as e:
+            logger.debug(f"[Telegram] Could not fetch registered commands: {e}")
+            return None
+        return result.get("result") if result.get("ok") else None
+
     def _format_markdown(self, text: str) -> str:
         """Converts basic Markdown to Telegram-compatible HTML, avoiding interleaved tags."""
-        
-        # 1. Handle code blocks and inline code FIRST using opaque placeholders
-        # This protects their content from being escaped or modified by other rules
-        placeholders = []
-        
-        def save_placeholder(tag, content):
-            idx = len(placeholders)
-            # Use unique tokens that won't be matched by bold/italic regex (no * or _)
-            placeholder = f"§{tag}{idx}§"
-            # Escape HTML inside code
-            escaped_content = html.escape(content)
-            if tag == "pre":
-                placeholders.append(f"<pre>{escaped_content}</pre>")
-            else:
-                placeholders.append(f"<code>{escaped_content}</code>")
-            return placeholder
-
-        # Multi-line code blocks
-        text = re.sub(r'```(.*?)```', lambda m: save_placeholder("pre", m.group(1)), text, flags=re.DOTALL)
-        # Inline code
-        text = re.sub(r'`(.*?)`', lambda m: save_placeholder("code", m.group(1)), text)
-        
-        # 2. Protect URLs in Markdown links before escaping or formatting
-        # This prevents underscores in URLs from being turned into <i> tags
-        def save_url_placeholder(match):
-            idx = len(placeholders)
-            placeholder = f"§url{idx}§"
-            placeholders.append(match.group(2))
-            return f"[{match.group(1)}]({placeholder})"
-            
-        text = re.sub(r'\[(.*?)\]\((.*?)\)', save_url_placeholder, text)
-
-        # 3. Escape HTML special characters for the rest of the text
-        text = html.escape(text)
-
-        # 4. Handle Headers (convert to bold)
-        def clean_header(match):
-            content = match.group(2)
-            # Remove MD formatting from headers to prevent nesting complications
-            content = re.sub(r'[\*_]', '', content)
-            return f"<b>{content}</b>"
-            
-        text = re.sub(r'^(#{1,6})\s+(.*)$', clean_header, text, flags=re.MULTILINE)
-
-        # 5. Bold: **text** or __text__ -> <b>text</b>
-        # Require that the first/last characters are not whitespace or the symbol itself 
-        # to prevent triple-symbol interleaving (e.g., ***triple*** matching ** then *)
-        text = re.sub(r'\*\*([^\s\*](?:.*?[^\s\*])?)\*\*', r'<b>\1</b>', text)
-        text = re.sub(r'\_\_([^\s\_](?:.*?[^\s\_])?)\_\_', r'<b>\1</b>', text)
-
-        # 6. Italic: *text* or _text_ -> <i>text</i>
-        text = re.sub(r'(?<!\*)\*([^\s\*](?:.*?[^\s\*])?)\*(?!\*)', r'<i>\1</i>', text)
-        text = re.sub(r'(?<!\_)\_([^\s\_](?:.*?[^\s\_])?)\_(?!\_)', r'<i>\1</i>', text)
-
-        # 7. Finalize Hyperlinks: [text](PLACEHOLDER) -> <a href="original_url">text</a>
-        # This converts the protected link structure to final HTML
-        def restore_link(match):
-            text_part = match.group(1)
-            placeholder = match.group(2)
-            # Find the original URL from placeholders
-            match_p = re.match(r'§url(\d+)§', placeholder)
-            if match_p:
-                url = placeholders[int(match_p.group(1))]
-                return f'<a href="{url}">{text_part}</a>'
-            return match.group(0) # Should not happen
-
-        text = re.sub(r'\[(.*?)\]\((§url\d+§)\)', restore_link, text)
-
-        # 8. Unordered Lists: * item or - item -> • item
-        text = re.sub(r'^\s*[\*\-]\s+(.*)$', r'• \1', text, flags=re.MULTILINE)
-
-        # 9. Restore Code/Pre placeholders
-        for i, val in enumerate(placeholders):
-            # Only restore pre/code; URLs are handled in step 7
-            text = text.replace(f"§pre{i}§", val).replace(f"§code{i}§", val)
-
-        return text
+        if _MD_CHARS.isdisjoint(text):
+            # Plain text: HTML parse mode still requires &, < and > to be escaped
+            return html.escape(text)
+        if len(text) > _FORMAT_CACHE_MAX_TEXT:
+            return _format_markdown_uncached(text)
+        return _format_markdown_cached(text)
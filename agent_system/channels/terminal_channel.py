@@ -2,10 +2,60 @@ import os
 import sys
 import time
 import re
+import functools
 from typing import Union, Optional
 from agent_system.core.channel import Channel, FileAttachment
 from agent_system.utils import logger
 
+# Patterns used by _format_markdown, compiled once at import time
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC_STAR_RE = re.compile(r'(?<!\*)\*([^\s\*].*?[^\s\*])\*(?!\*)')
+_ITALIC_UNDER_RE = re.compile(r'(?<!_)_([^\s_].*?[^\s_])_(?!_)')
+_CODE_BLOCK_RE = re.compile(r'```(.*?)```', re.DOTALL)
+_INLINE_CODE_RE = re.compile(r'`(.*?)`')
+_MD_LINK_RE = re.compile(r'\[(.*?)\]\((.*?)\)')
+_HEADER_RE = re.compile(r'^(#{1,6})\s+(.*)$', re.MULTILINE)
+_LIST_RE = re.compile(r'^\s*[\*\-]\s+(.*)$', re.MULTILINE)
+
+def _format_markdown_uncached(text: str) -> str:
+    """Converts basic Markdown to Terminal ANSI escape codes."""
+    # Reset code
+    reset = "\033[0m"
+    bold = "\033[1m"
+    italic = "\033[3m"
+    cyan = "\033[36m"
+    
+    # 1. Bold: **text** -> \033[1mtext\033[0m
+    text = _BOLD_RE.sub(f'{bold}\\1{reset}', text)
+
+    # 2. Italic: *text* or _text_ -> \033[3mtext\033[0m
+    text = _ITALIC_STAR_RE.sub(f'{italic}\\1{reset}', text)
+    text = _ITALIC_UNDER_RE.sub(f'{italic}\\1{reset}', text)
+
+    # 3. Code blocks: ```code``` -> \033[36mcode\033[0m (Cyan)
+    text = _CODE_BLOCK_RE.sub(f'{cyan}\\1{reset}', text)
+
+    # 4. Inline code: `code` -> \033[36mcode\033[0m
+    text = _INLINE_CODE_RE.sub(f'{cyan}\\1{reset}', text)
+
+    # 5. Hyperlinks: [text](url) -> text (url)
+    text = _MD_LINK_RE.sub(r'\1 (\2)', text)
+
+    # 6. Headers: # Header -> BOLD Header
+    text = _HEADER_RE.sub(f'{bold}\\2{reset}', text)
+
+    # 7. Unordered Lists: * item or - item -> • item
+    text = _LIST_RE.sub(r'• \1', text)
+
+    return text
+
+# Characters that can trigger any _format_markdown rule
+_MD_CHARS = frozenset("*_`[#-")
+
+# Formatting is a pure function of the text; very long texts bypass the cache
+_FORMAT_CACHE_MAX_TEXT = 8192
+_format_markdown_cached = functools.lru_cache(maxsize=512)(_format_markdown_uncached)
+
 class TerminalChannel(Channel):
     """Implementation of I/O via the terminal."""
     
@@ -13,41 +63,34 @@ class TerminalChannel(Channel):
         self.name = "terminal"
 
     def get_input(self) -> Union[str, FileAttachment]:
-        try:
-            if not sys.stdin or not sys.stdin.isatty():
-                # If not interactive, check if we can read anything or if it's just closed/EOF immediately
-                # But easiest is just to try input() and catch EOFError, 
-                # OR if we know for sure it's non-interactive and likely to fail, we can skip.
-                # However, piping "echo hi | python main.py" is non-interactive but valid input.
-                # So we should rely on the try/except.
-                pass
-
-            user_input = input("> ")
-        except EOFError:
-            logger.warning("[Terminal] Input stream closed (EOF). Switching to output-only mode.")
-            while True:
-                time.sleep(3600) # Sleep indefinitely to keep thread alive but idle
+        while True:
+            try:
+                if not sys.stdin or not sys.stdin.isatty():
+                    # If not interactive, check if we can read anything or if it's just closed/EOF immediately
+                    # But easiest is just to try input() and catch EOFError, 
+                    # OR if we know for sure it's non-interactive and likely to fail, we can skip.
+                    # However, piping "echo hi | python main.py" is non-interactive but valid input.
+                    # So we should rely on the try/except.
+                    pass
+
+                user_input = input("> ")
+            except EOFError:
+                logger.warning("[Terminal] Input stream closed (EOF). Switching to output-only mode.")
+                while True:
+                    time.sleep(3600) # Sleep indefinitely to keep thread alive but idle
             
-        
-        # Handle /file <path> command
-        if user_input.startswith("/file "):
-            # Slicing explicitly to avoid lint complaints if any, though it's standard
-            parts = user_input.split(" ", 1)
-            if len(parts) > 1:
-                file_path = parts[1].strip()
-            if os.path.exists(file_path) and os.path.isfile(file_path):
-                filename = os.path.basename(file_path)
-                
-                def getter():
-                    with open(file_path, "rb") as f:
-                        return f.read()
-                
-                return FileAttachment(name=filename, content_getter=getter)
-            else:
+            # Handle /file <path> command
+            if user_input.startswith("/file "):
+                # "/file " guarantees a second part, so file_path is always bound
+                file_path = user_input.split(" ", 1)[1].strip()
+                if os.path.isfile(file_path):
+                    filename = os.path.basename(file_path)
+                    # The engine streams from the open file instead of reading it into memory
+                    return FileAttachment(name=filename, content_getter=lambda: open(file_path, "rb"))
                 logger.error(f"File not found at {file_path}")
-                return self.get_input() # Retry
+                continue # Ask again
                 
-        return user_input
+            return user_input
     
     def send_output(self, text: str):
         formatted_text = self._format_markdown(text)
@@ -72,32 +115,8 @@ class TerminalChannel(Channel):
 
     def _format_markdown(self, text: str) -> str:
         """Converts basic Markdown to Terminal ANSI escape codes."""
-        # Reset code
-        reset = "\033[0m"
-        bold = "\033[1m"
-        italic = "\033[3m"
-        cyan = "\033[36m"
-        
-        # 1. Bold: **text** -> \033[1mtext\033[0m
-        text = re.sub(r'\*\*(.*?)\*\*', f'{bold}\\1{reset}', text)
-
-        # 2. Italic: *text* or _text_ -> \033[3mtext\033[0m
-        text = re.sub(r'(?<!\*)\*([^\s\*].*?[^\s\*])\*(?!\*)', f'{italic}\\1{reset}', text)
-        text = re.sub(r'(?<!_)_([^\s_].*?[^\s_])_(?!_)', f'{italic}\\1{reset}', text)
-
-        # 3. Code blocks: ```code``` -> \033[36mcode\033[0m (Cyan)
-        text = re.sub(r'```(.*?)```', f'{cyan}\\1{reset}', text, flags=re.DOTALL)
-
-        # 4. Inline code: `code` -> \033[36mcode\033[0m
-        text = re.sub(r'`(.*?)`', f'{cyan}\\1{reset}', text)
-
-        # 5. Hyperlinks: [text](url) -> text (url)
-        text = re.sub(r'\[(.*?)\]\((.*?)\)', r'\1 (\2)', text)
-
-        # 6. Headers: # Header -> BOLD Header
-        text = re.sub(r'^(#{1,6})\s+(.*)$', f'{bold}\\2{reset}', text, flags=re.MULTILINE)
-
-        # 7. Unordered Lists: * item or - item -> • item
-        text = re.sub(r'^\s*[\*\-]\s+(.*)$', r'• \1', text, flags=re.MULTILINE)
-
-        return text
+        if _MD_CHARS.isdisjoint(text):
+            return text
+        if len(text) > _FORMAT_CACHE_MAX_TEXT:
+            return _format_markdown_uncached(text)
+        return _format_markdown_cached(text)
@@ -1,15 +1,27 @@
+import io
 from abc import ABC, abstractmethod
-from typing import Union, Callable, Optional
+from typing import Union, Callable, Optional, BinaryIO
 from dataclasses import dataclass
 
 @dataclass
 class FileAttachment:
-    """Represents a file attached to a message."""
+    """Represents a file attached to a message.
+
+    `content_getter` returns either the raw bytes or a readable binary file object
+    positioned at the start, which the consumer reads and closes.
+    """
     name: str
-    content_getter: Callable[[], bytes]
+    content_getter: Callable[[], Union[bytes, BinaryIO]]
     mime_type: Optional[str] = None
     caption: Optional[str] = None
 
+    def open_stream(self) -> BinaryIO:
+        """Returns the content as a readable binary stream, usable as a context manager."""
+        content = self.content_getter()
+        if isinstance(content, bytes):
+            return io.BytesIO(content)
+        return content
+
 class Channel(ABC):
     """Abstract base class for I/O channels."""
     
@@ -1,19 +1,41 @@
 import os
+import copy
+import collections
+import functools
 import importlib.util
+import inspect
 import shutil
-import queue
 import threading
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any, Union, Optional
+from typing import List, Dict, Any, Union, Optional, Callable
 from agent_system.core.provider import Provider
 from agent_system.core.channel import Channel, FileAttachment
 from agent_system.core.scheduler import Scheduler, ScheduledTask
 from utils.persistence import Persistence
 from agent_system.utils import logger
 
+
+@functools.lru_cache(maxsize=16)
+def _read_prompt_file(path: str, mtime_ns: int) -> str:
+    """Reads a prompt file; the mtime in the key makes edits invalidate the cached text."""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+class _MainThreadCall:
+    """Result of background work, queued so the main loop applies it between turns."""
+
+    def __init__(self, fn: Callable[[], None]):
+        self.fn = fn
+
+
 class Engine:
     """The central loop coordinating channels, providers, and persistence."""
+
+    # file path -> (mtime_ns, tool entry or None), shared so /reload only re-executes changed tools
+    _tool_module_cache: Dict[str, Any] = {}
     
     def __init__(self, provider: Provider, channels: Union[Channel, List[Channel]], persistence: Persistence, 
                  system_prompt_path: str = "memory/SYSTEM.md", tools_dir: str = "tools", 
@@ -29,10 +51,22 @@ class Engine:
         self.context_compact_threshold = context_compact_threshold
         self.system_prompt = self._load_system_prompt(self.system_prompt_path)
         self.tools = {}
+        # Schema list handed to the provider on every model call, rebuilt by load_tools
+        self._tool_schemas: Optional[List[Dict[str, Any]]] = None
         self.commands = {}
         
         # Multi-channel support
-        self.input_queue = queue.Queue()
+        # The main loop is the only consumer: deque append/popleft are atomic, and the
+        # event only wakes the loop up when the inbox was empty
+        self._inbox = collections.deque()
+        self._inbox_event = threading.Event()
+        # Inputs already taken off the inbox and coalesced, waiting for their turn
+        self._pending_inputs = collections.deque()
+
+        # Auto-titling and compaction run here so they don't stall the next user turn
+        self._bg_pool = ThreadPoolExecutor(max_workers=2)
+        self._titling_session: Optional[str] = None
+        self._compacting = False
         self.current_channel = self.channels[0] # Default to first channel
         
         # Scheduler
@@ -44,49 +78,65 @@ class Engine:
 
     def _ensure_dirs(self):
         """Ensures that required directories exist."""
-        for d in [self.tools_dir, self.workspace_dir]:
-            if not os.path.exists(d):
-                os.makedirs(d)
-        
-        # Ensure output dir inside workspace exists
-        output_dir = os.path.join(self.workspace_dir, "output")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        # Includes the output dir inside the workspace; exist_ok avoids a separate exists() check
+        for d in [self.tools_dir, self.workspace_dir, os.path.join(self.workspace_dir, "output")]:
+            os.makedirs(d, exist_ok=True)
 
     def load_tools(self):
         """Dynamically loads tools from the tools directory."""
         self.tools = {}
-        for filename in os.listdir(self.tools_dir):
-            if filename.endswith(".py") and not filename.startswith("__"):
-                module_name = filename[:-3]
-                file_path = os.path.join(self.tools_dir, filename)
-                
-                try:
-                    spec = importlib.util.spec_from_file_location(module_name, file_path)
-                    if spec is not None:
-                        module = importlib.util.module_from_spec(spec)
-                        if spec.loader:
-                            spec.loader.exec_module(module)
-                        
-                        if hasattr(module, "SCHEMA") and hasattr(module, "execute"):
-                            # Extract display_name for user feedback, but keep SCHEMA clean for the API
-                            schema = module.SCHEMA.copy()
-                            display_name = schema.pop("display_name", schema["name"])
-                            
-                            self.tools[module.SCHEMA["name"]] = {
-                                "schema": schema,
-                                "display_name": display_name,
-                                "execute": module.execute
-                            }
-                            logger.info(f"[Engine] Loaded tool: {module.SCHEMA['name']}")
-                except Exception as e:
-                    logger.error(f"[Engine] Failed to load tool {module_name}: {str(e)}")
+        with os.scandir(self.tools_dir) as it:
+            entries = [e for e in it if e.name.endswith(".py") and not e.name.startswith("__")]
+        for entry in entries:
+            module_name = entry.name[:-3]
+            file_path = entry.path
+            
+            try:
+                # Reuse the already-loaded tool when its file has not changed since the last load
+                mtime = entry.stat().st_mtime_ns
+                cached = Engine._tool_module_cache.get(file_path)
+                if cached and cached[0] == mtime:
+                    tool = cached[1]
+                else:
+                    tool = self._load_tool_module(module_name, file_path)
+                    Engine._tool_module_cache[file_path] = (mtime, tool)
+
+                if tool:
+                    self.tools[tool["schema"]["name"]] = tool
+                    logger.info("[Engine] Loaded tool: %s", tool["schema"]["name"])
+            except Exception as e:
+                logger.error("[Engine] Failed to load tool %s: %s", module_name, e)
+
+        self._tool_schemas = [t["schema"] for t in self.tools.values()] or None
+
+    def _load_tool_module(self, module_name: str, file_path: str) -> Optional[Dict[str, Any]]:
+        """Executes a tool module and returns its tool entry, or None if it is not a tool."""
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        if spec is None:
+            return None
+        module = importlib.util.module_from_spec(spec)
+        if spec.loader:
+            spec.loader.exec_module(module)
+        
+        if not (hasattr(module, "SCHEMA") and hasattr(module, "execute")):
+            return None
+
+        # Extract display_name for user feedback, but keep SCHEMA clean for the API
+        schema = module.SCHEMA.copy()
+        display_name = schema.pop("display_name", schema["name"])
+        
+        return {
+            "schema": schema,
+            "display_name": display_name,
+            "execute": module.execute
+        }
 
     def _load_system_prompt(self, path: str) -> str:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read().strip()
-        return "You are a helpful assistant."
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return "You are a helpful assistant."
+        return _read_prompt_file(path, mtime_ns)
 
     def _register_commands(self):
         """Registers built-in slash commands."""
@@ -140,12 +190,19 @@ class Engine:
                 "description": "Exit the session (alias for /exit)"
             }
         }
+        # Handler signatures never change, so decide once whether each one takes arguments
+        for info in self.commands.values():
+            info["accepts_args"] = len(inspect.signature(info["handler"]).parameters) > 0
+        self._build_help_text()
+
+    def _build_help_text(self):
+        """Precomputes the /help output from the registered commands."""
+        self._help_text = "Available Slash Commands:\n" + "".join(
+            f"  {cmd.ljust(10)} - {info['description']}\n" for cmd, info in sorted(self.commands.items())
+        )
 
     def _handle_help(self):
-        help_text = "Available Slash Commands:\n"
-        for cmd, info in sorted(self.commands.items()):
-            help_text += f"  {cmd.ljust(10)} - {info['description']}\n"
-        self.current_channel.send_output(help_text)
+        self.current_channel.send_output(self._help_text)
         return True
 
     def _handle_usage(self):
@@ -160,18 +217,10 @@ class Engine:
         return True
 
     def _handle_compact(self):
-        self.current_channel.send_status("Compacting context... please wait.")
-        
-        # Load full raw history to salvage metadata
-        raw_entries = []
-        if os.path.exists(self.persistence.session_file):
-            with open(self.persistence.session_file, "r", encoding="utf-8") as f:
-                for line in f:
-                    try:
-                        raw_entries.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        continue
-        
+        if self._compacting:
+            self.current_channel.send_output("Compaction is already in progress.")
+            return True
+
         # Load logical message history
         messages = self.persistence.load_history()
         if len(messages) <= 6:
@@ -189,7 +238,6 @@ class Engine:
             return True
             
         history_to_summarize = messages[:split_index]
-        history_to_keep = messages[split_index:]
         
         summary_prompt = (
             "Please provide a concise summary of our conversation so far, capturing all important details and context. "
@@ -198,10 +246,44 @@ class Engine:
             "Begin the summary immediately without any preamble."
         )
         
-        # Generate summary using the provider
+        # Generate the summary in the background so the loop keeps serving input meanwhile
+        self.current_channel.send_status("Compacting context in the background...")
         temp_messages = [{"role": "system", "content": self.system_prompt}] + history_to_summarize + [{"role": "user", "content": summary_prompt}]
-        summary = self.provider.generate_response(temp_messages)
-        
+        session_file = self.persistence.session_file
+        self._compacting = True
+        self._run_in_background(
+            self.current_channel,
+            lambda: self.provider.generate_response(temp_messages, background=True),
+            lambda summary: self._apply_compaction(session_file, split_index, summary),
+            on_error=self._compaction_failed
+        )
+        return True
+
+    def _compaction_failed(self, error: Exception):
+        self._compacting = False
+        logger.error("[Engine] Compaction failed: %s", error)
+        self.current_channel.send_output(f"Compaction failed: {error}")
+
+    def _apply_compaction(self, session_file: str, split_index: int, summary: str):
+        """Replaces the first split_index messages of the session with the summary (main loop only)."""
+        self._compacting = False
+        if self.persistence.session_file != session_file:
+            logger.info("[Engine] Session changed while compacting. Discarding the summary.")
+            return
+
+        # Load full raw history to salvage metadata
+        raw_entries = []
+        if os.path.exists(self.persistence.session_file):
+            with open(self.persistence.session_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        raw_entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+
+        # Messages that arrived while the summary was generated are kept as well
+        history_to_keep = self.persistence.load_history()[split_index:]
+
         # Prepare the new messages
         new_messages = [
             {"role": "system", "content": f"Summary of previous conversation:\n{summary}"},
@@ -224,9 +306,9 @@ class Engine:
                 msg["timestamp"] = datetime.now().isoformat()
                 serializable_msg = self.persistence._make_serializable(msg)
                 f.write(json.dumps(serializable_msg) + "\n")
+        self.persistence.invalidate_history_cache()
                 
         self.current_channel.send_output(f"Context compacted. Preserved the last {len(history_to_keep)} turns and session metadata.")
-        return True
 
     def _handle_clear(self):
         self.persistence.start_new_session()
@@ -236,15 +318,15 @@ class Engine:
     def _handle_reset(self):
         self.persistence.start_new_session()
         # Empty workspace
-        for item in os.listdir(self.workspace_dir):
-            item_path = os.path.join(self.workspace_dir, item)
-            try:
-                if os.path.isfile(item_path) or os.path.islink(item_path):
-                    os.unlink(item_path)
-                elif os.path.isdir(item_path):
-                    shutil.rmtree(item_path)
-            except Exception as e:
-                logger.error(f"[Engine] Failed to delete {item_path}: {e}")
+        with os.scandir(self.workspace_dir) as it:
+            for entry in it:
+                try:
+                    if entry.is_file() or entry.is_symlink():
+                        os.unlink(entry.path)
+                    elif entry.is_dir():
+                        shutil.rmtree(entry.path)
+                except Exception as e:
+                    logger.error("[Engine] Failed to delete %s: %s", entry.path, e)
         
         # Re-ensure workspace structure (especially the 'output' folder)
         self._ensure_dirs()
@@ -307,13 +389,13 @@ class Engine:
         return False # Returning False signals the loop to break
 
     def _poll_channel(self, channel: Channel):
-        """Polls a single channel for input and puts it in the shared queue."""
+        """Polls a single channel for input and puts it in the shared inbox."""
         while True:
             try:
                 user_input = channel.get_input()
-                self.input_queue.put((channel, user_input))
+                self._put_input(channel, user_input)
             except Exception as e:
-                logger.error(f"[Engine] Error polling channel: {e}")
+                logger.error("[Engine] Error polling channel: %s", e)
                 break
 
     def _on_scheduled_task(self, task: ScheduledTask):
@@ -326,14 +408,90 @@ class Engine:
                 break
         
         # Use the target channel for routing to the loop
-        self.input_queue.put((target_channel, task))
+        self._put_input(target_channel, task)
+
+    def _run_in_background(self, channel: Channel, work: Callable[[], Any], on_result: Callable[[Any], None],
+                           on_error: Callable[[Exception], None]):
+        """Runs work on the background pool and hands its result (or error) back to the main loop."""
+        def done(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                self._put_input(channel, _MainThreadCall(functools.partial(on_error, e)))
+                return
+            self._put_input(channel, _MainThreadCall(functools.partial(on_result, result)))
+        self._bg_pool.submit(work).add_done_callback(done)
+
+    def _apply_auto_title(self, session_file: str, title: Any):
+        self._titling_session = None
+        # The user may have switched sessions or named this one in the meantime
+        if self.persistence.session_file != session_file or self.persistence.has_title():
+            return
+        if isinstance(title, str) and title.strip():
+            # Clean up common AI artifacts if any
+            title = title.strip().strip('"')
+            self.persistence.set_session_title(title)
+            logger.info("[Engine] Auto-titled session: %s", title)
+
+    def _auto_title_failed(self, error: Exception):
+        self._titling_session = None
+        logger.error("[Engine] Failed to auto-title session: %s", error)
+
+    def _put_input(self, channel: Channel, user_input: Any):
+        """Hands an input to the main loop. Safe to call from any thread."""
+        self._inbox.append((channel, user_input))
+        self._inbox_event.set()
+
+    def _next_input(self):
+        """Returns the next (channel, input) pair, merging inputs that arrived together."""
+        if not self._pending_inputs:
+            while not self._inbox:
+                self._inbox_event.wait()
+                self._inbox_event.clear()
+            # Take everything that is already waiting
+            batch = []
+            while self._inbox:
+                batch.append(self._inbox.popleft())
+            self._pending_inputs.extend(self._coalesce_inputs(batch))
+        return self._pending_inputs.popleft()
+
+    def _coalesce_inputs(self, batch: List[tuple]) -> List[tuple]:
+        """Merges consecutive plain-text messages, and consecutive scheduled tasks for the
+        same session, from the same channel so a burst costs a single model turn.
+        Slash commands and file attachments are always kept as separate inputs."""
+        groups = []
+        for channel, item in batch:
+            if isinstance(item, ScheduledTask):
+                key = ("task", item.session_file)
+            elif isinstance(item, str) and not item.startswith("/"):
+                key = ("text", None)
+            else:
+                key = None
+            if key and groups and groups[-1][0] is channel and groups[-1][1] == key:
+                groups[-1][2].append(item)
+            else:
+                groups.append((channel, key, [item]))
+
+        merged = []
+        for channel, key, items in groups:
+            if len(items) == 1:
+                merged.append((channel, items[0]))
+            elif key[0] == "text":
+                merged.append((channel, "\n".join(items)))
+            else:
+                task = copy.copy(items[0])
+                task.prompt = "Scheduled Tasks:\n" + "\n".join(f"- {t.prompt}" for t in items)
+                merged.append((channel, task))
+        return merged
 
     def run(self):
         """Starts the conversation loop with multi-channel support."""
         for channel in self.channels:
             channel.set_commands(self.commands)
             channel.send_output("AI Agent System initialized. Type '/exit' or '/quit' to end the session.")
-            # Start a thread for each channel's get_input
+            # Start a thread for each channel's get_input. get_input is a blocking call
+            # (input(), HTTP long polling) that releases the GIL while it waits, so one
+            # thread per channel costs next to nothing and keeps channels independent.
             thread = threading.Thread(target=self._poll_channel, args=(channel,), daemon=True)
             thread.start()
         
@@ -343,14 +501,23 @@ class Engine:
         try:
             while True:
                 # Wait for input from ANY channel
-                self.current_channel, user_input = self.input_queue.get()
+                self.current_channel, user_input = self._next_input()
+
+                # Results of background work are applied here, on the main loop
+                if isinstance(user_input, _MainThreadCall):
+                    user_input.fn()
+                    continue
                 
                 # Handle File Attachments
                 if isinstance(user_input, FileAttachment):
                     self.current_channel.show_activity("upload_document")
                     file_path = os.path.join(self.workspace_dir, user_input.name)
-                    with open(file_path, "wb") as f:
-                        f.write(user_input.content_getter())
+                    # Copy in chunks instead of materializing the file. Write beside the target and
+                    # rename, so a source that is the target itself is never truncated mid-read.
+                    tmp_path = file_path + ".part"
+                    with user_input.open_stream() as src, open(tmp_path, "wb") as f:
+                        shutil.copyfileobj(src, f, 65536)
+                    os.replace(tmp_path, file_path)
                     
                     parts = [{"file_path": file_path, "mime_type": user_input.mime_type}]
                     if user_input.caption:
@@ -359,16 +526,16 @@ class Engine:
                     # Save as a multimodal user message
                     self.persistence.save_message("user", user_input.caption or f"[Uploaded {user_input.name}]", parts=parts)
                     
-                    is_audio = user_input.mime_type and user_input.mime_type.startswith("audio/")
-                    is_image = user_input.mime_type and user_input.mime_type.startswith("image/")
+                    mime_type = user_input.mime_type or ""
+                    is_audio = mime_type.startswith("audio/")
                     
-                    if is_audio or is_image or user_input.caption:
-                        logger.info(f"[Engine] Media/Captioned File Received (Stored as Parts): {user_input.name}")
+                    if is_audio or mime_type.startswith("image/") or user_input.caption:
+                        logger.info("[Engine] Media/Captioned File Received (Stored as Parts): %s", user_input.name)
                         if is_audio and not self.provider.supports_audio_parts():
                             tool = self.tools.get("transcribe_audio") if self.tools else None
                             if tool:
                                 try:
-                                    logger.info(f"[Engine] Auto-transcribing audio: {user_input.name}")
+                                    logger.info("[Engine] Auto-transcribing audio: %s", user_input.name)
                                     tparams = {
                                         "audio_file": user_input.name,
                                         "_workspace": self.workspace_dir,
@@ -380,7 +547,7 @@ class Engine:
                                             f"Audio transcription for '{user_input.name}':\n\n{transcript}"
                                         )
                                 except Exception as e:
-                                    logger.error(f"[Engine] Auto-transcription failed: {e}")
+                                    logger.error("[Engine] Auto-transcription failed: %s", e)
                                     self.persistence.save_message(
                                         "user",
                                         f"Audio transcription failed for '{user_input.name}': {e}"
@@ -389,7 +556,7 @@ class Engine:
                                 logger.warning("[Engine] transcribe_audio tool not available; skipping auto-transcription.")
                         # Proceed to model turn
                     else:
-                        logger.info(f"[Engine] File Received and Saved: {user_input.name}")
+                        logger.info("[Engine] File Received and Saved: %s", user_input.name)
                         # Keep system message for non-multimodal/non-captioned files just as a record
                         self.persistence.save_message("system", f"SYSTEM: User uploaded file '{user_input.name}'. It has been saved to the workspace.")
                         continue
@@ -398,21 +565,15 @@ class Engine:
                 if isinstance(user_input, ScheduledTask):
                     # Switch session if needed
                     if self.persistence.session_file != user_input.session_file:
-                        sessions = self.persistence.list_sessions()
-                        target_index = -1
-                        target_filename = os.path.basename(user_input.session_file)
-                        for s in sessions:
-                            if s["filename"] == target_filename:
-                                target_index = s["index"]
-                                break
+                        target_index = self.persistence.index_for_filename(os.path.basename(user_input.session_file))
                         
-                        if target_index != -1:
+                        if target_index is not None:
                             self.persistence.switch_session(target_index)
                             self.current_channel.send_output(f"Switched to session [{target_index}] for task.")
                         else:
                             self.persistence.start_new_session() # Fallback to new session if not found? Or just stay?
                             # Staying is prob safer, but let's log it.
-                            logger.warning(f"[Engine] Could not find session {user_input.session_file} for task. Staying in current session.")
+                            logger.warning("[Engine] Could not find session %s for task. Staying in current session.", user_input.session_file)
 
                     # Save as USER message but do not echo it.
                     # We use 'user' role because the model is trained to respond to user messages.
@@ -427,54 +588,55 @@ class Engine:
 
                 # Handle Slash Commands
                 if isinstance(user_input, str) and user_input.startswith("/"):
-                    parts = user_input.split(" ", 1)
-                    command = parts[0].lower().strip()
-                    args = parts[1] if len(parts) > 1 else None
+                    command, sep, args = user_input.partition(" ")
+                    command = command.lower().strip()
+                    entry = self.commands.get(command)
                     
-                    if command in self.commands:
-                        handler = self.commands[command]["handler"]
-                        # Check if handler accepts arguments
-                        import inspect
-                        sig = inspect.signature(handler)
-                        if len(sig.parameters) > 0:
-                            should_continue = handler(args)
-                        else:
-                            should_continue = handler()
-                            
-                        if not should_continue:
-                            break
-                        continue
-                    else:
+                    if entry is None:
                         self.current_channel.send_output(f"Unknown command: {command}. Type /help for available commands.")
                         continue
+
+                    handler = entry["handler"]
+                    if entry["accepts_args"]:
+                        should_continue = handler(args if sep else None)
+                    else:
+                        should_continue = handler()
+                        
+                    if not should_continue:
+                        break
+                    continue
                 
                 # Save user input
                 if isinstance(user_input, str):
                     self.persistence.save_message("user", user_input)
                     
-                    # Auto-titling for new sessions
-                    if not self.persistence.has_title():
-                        try:
-                            title_prompt = (
-                                f"Create a very concise (max 5 words) and descriptive title for a new conversation that starts with this message: \"{user_input}\". "
-                                "Respond ONLY with the title text, no quotes or preamble."
-                            )
-                            title = self.provider.generate_response([{"role": "user", "content": title_prompt}])
-                            if title and title.strip():
-                                # Clean up common AI artifacts if any
-                                title = title.strip().strip('"')
-                                self.persistence.set_session_title(title)
-                                logger.info(f"[Engine] Auto-titled session: {title}")
-                        except Exception as e:
-                            logger.error(f"[Engine] Failed to auto-title session: {e}")
+                    # Auto-titling for new sessions, generated in the background
+                    session_file = self.persistence.session_file
+                    if self._titling_session != session_file and not self.persistence.has_title():
+                        title_prompt = (
+                            f"Create a very concise (max 5 words) and descriptive title for a new conversation that starts with this message: \"{user_input}\". "
+                            "Respond ONLY with the title text, no quotes or preamble."
+                        )
+                        self._titling_session = session_file
+                        self._run_in_background(
+                            self.current_channel,
+                            lambda: self.provider.generate_response(
+                                [{"role": "user", "content": title_prompt}], background=True
+                            ),
+                            lambda title: self._apply_auto_title(session_file, title),
+                            on_error=self._auto_title_failed
+                        )
                 
                 # Conversation loop for tool calling
+                # Messages saved during the turn are written to disk together when it ends
+                self.persistence.begin_batch()
+
+                # The message list is built once per turn; each tool hop appends to it
+                messages = [{"role": "system", "content": self.system_prompt}]
+                messages.extend(self.persistence.load_history())
                 while True:
                     self.current_channel.show_activity("typing")
-                    messages = [{"role": "system", "content": self.system_prompt}]
-                    messages.extend(self.persistence.load_history())
-                    tool_schemas = [t["schema"] for t in self.tools.values()] if self.tools else None
-                    response = self.provider.generate_response(messages, tools=tool_schemas)
+                    response = self.provider.generate_response(messages, tools=self._tool_schemas)
                     
                     if isinstance(response, dict) and "tool_call" in response:
                         tc = response["tool_call"]
@@ -489,7 +651,7 @@ class Engine:
                             
                             try:
                                 # Save model's tool call structurally
-                                self.persistence.save_message("model", "", tool_call=tc)
+                                messages.append(self.persistence.save_message("model", "", tool_call=tc))
                                 
                                 # Add workspace dir to args for some tools if needed
                                 args["_workspace"] = self.workspace_dir
@@ -511,7 +673,7 @@ class Engine:
                                     result = f"{result}\n\n{sent_info}"
 
                                 # Save tool result structurally
-                                self.persistence.save_message("tool", result, name=tool_name, tool_result={"result": result})
+                                messages.append(self.persistence.save_message("tool", result, name=tool_name, tool_result={"result": result}))
                                 
                                 continue # Loop back to provider with result
                             except Exception as e:
@@ -540,12 +702,14 @@ class Engine:
                         self.current_channel.stop_activity()
                     break 
 
+                self.persistence.commit_batch()
+
                 # Auto-compact check
                 if self.context_compact_threshold:
                     usage = self.provider.get_usage()
                     total_tokens = usage.get('total_tokens', 0)
-                    if total_tokens > self.context_compact_threshold:
-                        logger.info(f"[Engine] Token usage {total_tokens} exceeds threshold {self.context_compact_threshold}. Compacting...")
+                    if total_tokens > self.context_compact_threshold and not self._compacting:
+                        logger.info("[Engine] Token usage %s exceeds threshold %s. Compacting...", total_tokens, self.context_compact_threshold)
                         self._handle_compact()
 
         except KeyboardInterrupt:
@@ -554,7 +718,9 @@ class Engine:
         finally:
             # Explicit cleanup
             logger.info("[Engine] Shutting down...")
+            self.persistence.commit_batch()
             self.scheduler.stop()
+            self._bg_pool.shutdown(wait=False)
             for channel in self.channels:
                 if hasattr(channel, "stop_activity"):
                     channel.stop_activity()
@@ -563,27 +729,36 @@ class Engine:
         """Scans the workspace/output directory and sends files via the active channel. 
         Returns a string summary of sent files."""
         output_dir = os.path.join(self.workspace_dir, "output")
-        if not os.path.exists(output_dir):
+        try:
+            with os.scandir(output_dir) as it:
+                files = [(entry.name, entry.path) for entry in it if entry.is_file()]
+        except FileNotFoundError:
+            return ""
+        if not files:
             return ""
 
-        sent_files = []
-        for filename in os.listdir(output_dir):
-            file_path = os.path.join(output_dir, filename)
-            if os.path.isfile(file_path):
-                # Move to a 'processed' folder first to get the final path
-                processed_dir = os.path.join(self.workspace_dir, "processed")
-                if not os.path.exists(processed_dir):
-                    os.makedirs(processed_dir)
-                
-                final_path = os.path.join(processed_dir, filename)
+        # Move to a 'processed' folder first to get the final path
+        processed_dir = os.path.join(self.workspace_dir, "processed")
+        os.makedirs(processed_dir, exist_ok=True)
+
+        moved = []
+        for filename, file_path in files:
+            final_path = os.path.join(processed_dir, filename)
+            try:
+                # Same filesystem: a single rename
+                os.replace(file_path, final_path)
+            except OSError:
                 shutil.move(file_path, final_path)
-                
-                # Send the file with the accurate path to the ACTIVE channel
-                self.current_channel.send_file(final_path, caption=f"I've generated a file: {filename}")
-                
-                # Report the sandboxed path to the model
-                sandboxed_path = f"/workspace/processed/{filename}"
-                sent_files.append(sandboxed_path)
+            moved.append((filename, final_path))
+
+        # Send the files to the ACTIVE channel one at a time on purpose: Telegram orders
+        # messages by arrival, so concurrent uploads could be delivered out of order, and
+        # send_file (activity indicator, pending-send flag) is not thread-safe per channel.
+        for filename, final_path in moved:
+            self.current_channel.send_file(final_path, caption=f"I've generated a file: {filename}")
+
+        # Report the sandboxed paths to the model
+        sent_files = [f"/workspace/processed/{filename}" for filename, _ in moved]
 
         if sent_files:
             summary = "The following files were generated and successfully sent to the user. From the perspective of the sandbox, they are now located at:\n"
@@ -5,8 +5,13 @@ class Provider(ABC):
     """Abstract base class for LLM providers."""
     
     @abstractmethod
-    def generate_response(self, messages: List[Dict[str, str]], tools: Optional[List[Dict[str, Any]]] = None) -> str:
-        """Generates a response from the LLM based on the provided messages."""
+    def generate_response(self, messages: List[Dict[str, str]], tools: Optional[List[Dict[str, Any]]] = None,
+                          background: bool = False) -> str:
+        """Generates a response from the LLM based on the provided messages.
+
+        Background calls (titles, summaries) run concurrently with the main turn and
+        must not touch per-conversation state: last_usage and any request caches.
+        """
         ...
 
     @abstractmethod
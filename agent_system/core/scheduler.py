@@ -1,18 +1,35 @@
+import collections
+import heapq
+import itertools
 import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional, Callable
+from typing import List, Dict, Optional, Callable, Union
 from croniter import croniter
 from agent_system.utils import logger
+from utils.config import env_number
 from utils.persistence import Persistence
 
+# Longest the run loop sleeps without re-checking the clock, so wall-clock jumps
+# (suspend, NTP corrections) are noticed; override with SCHEDULER_MAX_SLEEP
+_MAX_SLEEP_SECONDS = env_number("SCHEDULER_MAX_SLEEP", 60.0, minimum=1.0)
+# Task executions within this window share a single rewrite of the tasks file
+_FLUSH_INTERVAL_SECONDS = 5.0
+
 class ScheduledTask:
+    __slots__ = ("id", "prompt", "session_file", "trigger_type", "trigger_value", "channel_name",
+                 "created_at", "_croniter", "_next_run", "next_run_ts")
+    # Serialized fields, in file order
+    _FIELDS = ("id", "prompt", "session_file", "channel_name", "trigger_type", "trigger_value",
+               "created_at", "next_run")
+
     def __init__(self, prompt: str, session_file: str, 
                  trigger_type: str, trigger_value: str, 
                  channel_name: str = "terminal",
                  task_id: Optional[str] = None, created_at: Optional[str] = None,
-                 next_run: Optional[str] = None):
+                 next_run: Optional[Union[str, datetime]] = None):
         self.id = task_id or str(uuid.uuid4())
         self.prompt = prompt
         self.session_file = session_file
@@ -20,17 +37,61 @@ class ScheduledTask:
         self.trigger_value = trigger_value
         self.channel_name = channel_name
         self.created_at = created_at or datetime.now().astimezone().isoformat()
+        # Parsed cron expression, created on first use and advanced tick by tick afterwards
+        self._croniter: Optional[croniter] = None
         self.next_run = next_run
         
         if not self.next_run:
             self.calculate_next_run()
 
-    def calculate_next_run(self):
+    @property
+    def next_run(self) -> Optional[str]:
+        return self._next_run
+
+    @next_run.setter
+    def next_run(self, value: Optional[Union[str, datetime]]):
+        # Keep the due time as an epoch float so the scheduler never re-parses the ISO string.
+        # Callers that already hold a datetime pass it directly and skip the parse.
+        self._next_run = value
+        self.next_run_ts: Optional[float] = None
+        if isinstance(value, datetime):
+            dt = value
+            self._next_run = dt.isoformat()
+        elif value:
+            try:
+                dt = datetime.fromisoformat(value)
+            except ValueError:
+                logger.error(f"[Scheduler] Invalid next_run format for task {self.id}: {value}")
+                return
+        else:
+            return
+        if dt.tzinfo is None:
+            # Naive values are taken as local time, as before, and stored with their offset
+            dt = dt.astimezone()
+            self._next_run = dt.isoformat()
+        self.next_run_ts = dt.timestamp()
+
+    def next_cron_run(self) -> str:
+        """Returns the next cron tick after the previous one, without re-parsing the expression.
+
+        croniter's get_next already searches field by field (month, day, hour, minute)
+        rather than stepping minute by minute, so there is no cheaper shortcut worth
+        the risk of getting DST or day-of-week rules wrong.
+        """
         now = datetime.now().astimezone()
+        if self._croniter is None:
+            self._croniter = croniter(self.trigger_value, now)
+        next_dt = self._croniter.get_next(datetime)
+        if next_dt <= now:
+            # Fell behind (e.g. the agent was not running): skip the missed ticks
+            self._croniter.set_current(now)
+            next_dt = self._croniter.get_next(datetime)
+        return next_dt.isoformat()
+
+    def calculate_next_run(self):
         if self.trigger_type == 'cron':
             try:
-                iter = croniter(self.trigger_value, now)
-                self.next_run = iter.get_next(datetime).isoformat()
+                self.next_run = self.next_cron_run()
             except Exception as e:
                 logger.error(f"[Scheduler] Error calculating next run for cron '{self.trigger_value}': {e}")
                 self.next_run = None
@@ -41,19 +102,11 @@ class ScheduledTask:
             self.next_run = self.trigger_value
 
     def to_dict(self) -> Dict[str, str]:
-        return {
-            "id": self.id,
-            "prompt": self.prompt,
-            "session_file": self.session_file,
-            "channel_name": self.channel_name,
-            "trigger_type": self.trigger_type,
-            "trigger_value": self.trigger_value,
-            "created_at": self.created_at,
-            "next_run": self.next_run
-        }
+        return {k: getattr(self, k) for k in self._FIELDS}
 
     @classmethod
     def from_dict(cls, data: Dict[str, str]) -> 'ScheduledTask':
+        # next_run is parsed to next_run_ts once here; the run loop only compares floats
         return cls(
             prompt=data["prompt"],
             session_file=data["session_file"],
@@ -69,20 +122,69 @@ class Scheduler:
     def __init__(self, persistence: Persistence, task_callback: Callable[[ScheduledTask], None]):
         self.persistence = persistence
         self.task_callback = task_callback
-        self.tasks: List[ScheduledTask] = []
+        # Tasks keyed by id, in the order they were added
+        self._tasks: Dict[str, ScheduledTask] = {}
         self.running = False
         self.thread: Optional[threading.Thread] = None
+        # Min-heap of (next_run_ts, seq, task) for every task with a valid due time;
+        # the run loop sleeps until the head is due or it is woken up.
+        # Entries of removed tasks stay behind and are skipped when popped.
+        # Only the run loop touches the heap once started: other threads queue new
+        # tasks on _added (deque appends are atomic) and set _wakeup.
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._added: collections.deque = collections.deque()
+        self._wakeup = threading.Event()
+        # Set when executions changed the task list; written out by _flush
+        self._dirty = False
+        self._last_flush = 0.0
+        # Serializes writes of the tasks file between callers and the run loop
+        self._save_lock = threading.Lock()
+        # Callbacks run off the loop thread so a slow one cannot delay the loop. One worker
+        # keeps them in heap order: tasks due on the same tick reach the engine's merged
+        # prompt in due-time order.
+        self._callback_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sched-cb")
         self._load_tasks()
 
     def _load_tasks(self):
         tasks_data = self.persistence.load_scheduled_tasks()
-        self.tasks = [ScheduledTask.from_dict(t) for t in tasks_data]
+        self._tasks = {}
+        for data in tasks_data:
+            task = ScheduledTask.from_dict(data)
+            self._tasks[task.id] = task
+            self._push(task)
         logger.info(f"[Scheduler] Loaded {len(self.tasks)} scheduled tasks.")
 
+    @property
+    def tasks(self) -> List[ScheduledTask]:
+        """A snapshot of the tasks for callers; the run loop never copies the task list."""
+        return list(self._tasks.values())
+
+    def _push(self, task: ScheduledTask):
+        if task.next_run_ts is not None:
+            heapq.heappush(self._heap, (task.next_run_ts, next(self._seq), task))
+
+    def _drain_added(self):
+        """Moves tasks queued by add_task onto the heap. Run loop only."""
+        while self._added:
+            self._push(self._added.popleft())
+
     def _save_tasks(self):
-        tasks_data = [t.to_dict() for t in self.tasks]
+        tasks_data = [t.to_dict() for t in list(self._tasks.values())]
         self.persistence.save_scheduled_tasks(tasks_data)
 
+    def _flush(self, force: bool = False):
+        """Saves the task list if it changed and the flush interval has passed."""
+        with self._save_lock:
+            if not self._dirty:
+                return
+            now_ts = time.time()
+            if not force and now_ts - self._last_flush < _FLUSH_INTERVAL_SECONDS:
+                return
+            self._dirty = False
+            self._last_flush = now_ts
+            self._save_tasks()
+
     def start(self):
         if self.running:
             return
@@ -93,31 +195,38 @@ class Scheduler:
 
     def stop(self):
         self.running = False
+        self._flush(force=True)
+        self._wakeup.set()
+        self._callback_pool.shutdown(wait=False)
         # Do not join thread here as it might block if called from within the thread (though unlikely)
         # But for clean shutdown, we might want to wait a bit or just let daemon thread die.
         logger.info("[Scheduler] Stopped background thread signal sent.")
 
-    def add_task(self, prompt: str, session_file: str, trigger_type: str, trigger_value: str, channel_name: str = "terminal") -> ScheduledTask:
-        task = ScheduledTask(prompt, session_file, trigger_type, trigger_value, channel_name=channel_name)
-        self.tasks.append(task)
-        self._save_tasks()
+    def add_task(self, prompt: str, session_file: str, trigger_type: str, trigger_value: str, channel_name: str = "terminal",
+                 next_run: Optional[datetime] = None) -> ScheduledTask:
+        """Adds and persists a task. next_run, if given, is the already parsed due time of an 'at' task."""
+        task = ScheduledTask(prompt, session_file, trigger_type, trigger_value, channel_name=channel_name, next_run=next_run)
+        self._tasks[task.id] = task
+        self._added.append(task)
+        # Changes made by the user are written right away
+        self._dirty = True
+        self._flush(force=True)
+        # Wake the loop in case this task is due before the one it is waiting for
+        self._wakeup.set()
         logger.info(f"[Scheduler] Added task {task.id}: {trigger_type}={trigger_value}, channel={channel_name}, next_run={task.next_run}")
         return task
 
     def remove_task(self, task_id: str) -> bool:
-        for i, task in enumerate(self.tasks):
-            if task.id == task_id:
-                del self.tasks[i]
-                self._save_tasks()
-                logger.info(f"[Scheduler] Removed task {task_id}")
-                return True
-        return False
+        # Its heap entry is skipped by the run loop once the id is gone
+        if self._tasks.pop(task_id, None) is None:
+            return False
+        self._dirty = True
+        self._flush(force=True)
+        logger.info(f"[Scheduler] Removed task {task_id}")
+        return True
     
     def get_task(self, task_id: str) -> Optional[ScheduledTask]:
-        for task in self.tasks:
-            if task.id == task_id:
-                return task
-        return None
+        return self._tasks.get(task_id)
 
     def list_tasks(self) -> List[ScheduledTask]:
         return self.tasks
@@ -125,56 +234,69 @@ class Scheduler:
     def _run_loop(self):
         logger.info("[Scheduler] Run loop started.")
         while self.running:
+            self._drain_added()
+            self._flush()
+            if not self._tasks:
+                # Only entries of removed tasks can be left; sleep until add_task or stop
+                self._heap.clear()
+            timeout = _MAX_SLEEP_SECONDS
+            if self._dirty:
+                # Wake up in time to write out the pending changes
+                timeout = min(timeout, self._last_flush + _FLUSH_INTERVAL_SECONDS - time.time())
+            if self._heap:
+                delay = self._heap[0][0] - time.time()
+                if delay > 0:
+                    self._wakeup.wait(timeout=min(delay, timeout))
+                    # Cleared before the next drain, so a task queued meanwhile is not missed
+                    self._wakeup.clear()
+                    continue
+            else:
+                self._wakeup.wait(timeout=timeout if self._dirty else None)
+                self._wakeup.clear()
+                continue
             try:
                 self._check_and_run_tasks()
             except Exception as e:
                 logger.error(f"[Scheduler] Error in loop: {e}")
-            time.sleep(1) 
+        # Executions after stop() wrote the file are not lost
+        self._flush(force=True)
+
+    def _run_callback(self, task: ScheduledTask):
+        try:
+            self.task_callback(task)
+        except Exception as e:
+            logger.error(f"[Scheduler] Error executing task callback: {e}")
 
     def _check_and_run_tasks(self):
-        now = datetime.now().astimezone()
+        """Runs every task at the head of the heap that is due. Run loop only."""
+        now_ts = time.time()
         tasks_executed = False
         
-        # Copy list to avoid modification during iteration if we remove
-        for task in self.tasks[:]:
-            if not task.next_run:
-                continue
-                
-            try:
-                next_run_dt = datetime.fromisoformat(task.next_run)
-                # Ensure next_run_dt is aware if it wasn't already (backwards compatibility or just safety)
-                if next_run_dt.tzinfo is None:
-                     next_run_dt = next_run_dt.replace(tzinfo=now.tzinfo)
-            except ValueError:
-                logger.error(f"[Scheduler] Invalid next_run format for task {task.id}: {task.next_run}")
+        while self._heap and self._heap[0][0] <= now_ts:
+            _, _, task = heapq.heappop(self._heap)
+            if self._tasks.get(task.id) is not task:
+                # Removed since it was scheduled
                 continue
+            logger.info(f"[Scheduler] Triggering task {task.id} (due {task.next_run})")
+            
+            self._callback_pool.submit(self._run_callback, task)
+            tasks_executed = True
 
-            if now >= next_run_dt:
-                logger.info(f"[Scheduler] Triggering task {task.id} (due {task.next_run})")
-                
-                # Execute callback
+            # Handle next iteration or removal
+            if task.trigger_type == 'at':
+                # One-time task, remove it
+                self._tasks.pop(task.id, None)
+            elif task.trigger_type == 'cron':
+                # Recurrent task, calculate next run
                 try:
-                    self.task_callback(task)
+                    task.next_run = task.next_cron_run()
+                    self._push(task)
+                    logger.info(f"[Scheduler] Rescheduled cron task {task.id} to {task.next_run}")
                 except Exception as e:
-                    logger.error(f"[Scheduler] Error executing task callback: {e}")
-
-                tasks_executed = True
-
-                # Handle next iteration or removal
-                if task.trigger_type == 'at':
-                    # One-time task, remove it
-                    self.tasks.remove(task)
-                elif task.trigger_type == 'cron':
-                    # Recurrent task, calculate next run
-                    try:
-                        iter = croniter(task.trigger_value, now)
-                        task.next_run = iter.get_next(datetime).isoformat()
-                        logger.info(f"[Scheduler] Rescheduled cron task {task.id} to {task.next_run}")
-                    except Exception as e:
-                        logger.error(f"[Scheduler] Error rescheduling cron task {task.id}: {e}")
-                        # Remove if broken? Or keep trying? Let's keep it but next_run is invalid effectively?
-                        # Probably safest to leave it or disable it.
-                        pass
+                    logger.error(f"[Scheduler] Error rescheduling cron task {task.id}: {e}")
+                    # Remove if broken? Or keep trying? Let's keep it but next_run is invalid effectively?
+                    # Probably safest to leave it or disable it.
+                    pass
         
         if tasks_executed:
-            self._save_tasks()
+            self._dirty = True
@@ -1,7 +1,12 @@
+from binascii import b2a_base64
+import collections
+import threading
 import time
 import hashlib
 import json
 import os
+import random
+from datetime import datetime
 from typing import List, Dict, Any, Optional
 from agent_system.core.provider import Provider
 from agent_system.utils import logger
@@ -14,6 +19,80 @@ except ImportError:
     genai = None
     errors = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Internal message roles mapped to Google's; anything else is sent as user
+_ROLE_MAP = {"user": "user", "assistant": "model", "model": "model"}
+
+# Files larger than this go through the File API instead of being inlined in the request
+_INLINE_LIMIT_BYTES = 20 * 1024 * 1024
+
+# Uploaded files stay in PROCESSING for a while before they can be used in a request
+_UPLOAD_READY_TIMEOUT = 120.0
+_UPLOAD_POLL_INTERVAL = 1.0
+
+# File API uploads remembered per provider, most recently used last
+_UPLOADED_FILES_MAX = 32
+
+
+# Recently read attachments by (path, mtime_ns, size), most recently used last. Bounded
+# by total size rather than entry count, since each file may be up to _INLINE_LIMIT_BYTES.
+_FILE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_file_cache: "collections.OrderedDict[tuple, bytes]" = collections.OrderedDict()
+_file_cache_bytes = 0
+_file_cache_lock = threading.Lock()
+
+
+def _read_file_cached(path: str, mtime_ns: int, size: int) -> Optional[bytes]:
+    """Reads an attachment once per (path, mtime, size); a changed file gets a new key."""
+    global _file_cache_bytes
+    key = (path, mtime_ns, size)
+    with _file_cache_lock:
+        data = _file_cache.get(key)
+        if data is not None:
+            _file_cache.move_to_end(key)
+            return data
+
+    data = read_file_bytes(path)
+    if data is None or len(data) > _FILE_CACHE_MAX_BYTES:
+        return data
+    with _file_cache_lock:
+        if key not in _file_cache:
+            _file_cache[key] = data
+            _file_cache_bytes += len(data)
+            while _file_cache_bytes > _FILE_CACHE_MAX_BYTES:
+                _, evicted = _file_cache.popitem(last=False)
+                _file_cache_bytes -= len(evicted)
+    return data
+
+
+def _dumps_sorted(obj: Any) -> bytes:
+    """Serializes obj with sorted keys for fingerprinting, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # orjson is stricter (e.g. non-string keys); fall back to the stdlib
+            pass
+    return json.dumps(obj, sort_keys=True).encode()
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Seconds to wait before the next attempt: the server's Retry-After when it sends one,
+    otherwise exponential backoff from one second with full jitter."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        try:
+            return min(float(headers.get("Retry-After")), 60.0)
+        except (TypeError, ValueError):
+            # Missing, or an HTTP date rather than a number of seconds
+            pass
+    return min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
 class GoogleProvider(Provider):
     """Implementation of Google Generative Language API provider."""
     
@@ -33,108 +112,203 @@ class GoogleProvider(Provider):
         self._cached_content: Optional[Any] = None
         self._cached_config_hash: Optional[str] = None
         self._cache_ttl_seconds: int = 3600 # 1 hour default
+        # id(message) -> (message, converted contents entry) from the previous call
+        self._contents_cache: Dict[int, tuple] = {}
+        # (tools list, digest of its JSON); the engine passes the same list every turn
+        self._tools_digest: Optional[tuple] = None
+        # (path, mtime_ns, size) -> ACTIVE File returned by the File API for large attachments
+        self._uploaded_files: "collections.OrderedDict[tuple, Any]" = collections.OrderedDict()
+        self._uploaded_files_lock = threading.Lock()
 
     def _make_serializable(self, obj: Any) -> Any:
-        """Recursively converts bytes to base64 strings for JSON serialization."""
-        import base64
+        """Recursively converts bytes to base64 strings for JSON serialization.
+
+        function_response payloads are sent as JSON, so bytes cannot be passed through
+        raw here; each tool result is encoded once, when its message is first converted.
+        """
         if isinstance(obj, bytes):
-            return {"__bytes_b64__": base64.b64encode(obj).decode("utf-8")}
+            return {"__bytes_b64__": b2a_base64(obj, newline=False).decode("ascii")}
         if isinstance(obj, dict):
             return {k: self._make_serializable(v) for k, v in obj.items()}
         if isinstance(obj, list):
             return [self._make_serializable(v) for v in obj]
         return obj
 
-    def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None) -> Any:
-        if not self.client:
-            return "[Error: google-genai package not installed or API key missing]"
-        
-        # Convert internal message format to Google's contents format
-        contents = []
-        for msg in messages:
-            role = msg["role"]
-            if role == "system":
-                continue
-            
-            # Model response with tool call
-            if role == "model" and "tool_call" in msg:
-                tc = msg["tool_call"]
-                model_part = {
-                    "function_call": {
-                        "name": tc["name"],
-                        "args": tc["args"]
-                    }
+    def _convert_message(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        """Converts one non-system message to a Google contents entry."""
+        role = msg["role"]
+
+        # Model response with tool call
+        tc = msg.get("tool_call") if role == "model" else None
+        if tc is not None:
+            model_part = {
+                "function_call": {
+                    "name": tc["name"],
+                    "args": tc["args"]
                 }
-                if tc.get("thought_signature"):
-                    model_part["thought_signature"] = tc["thought_signature"]
-                    
-                contents.append({
-                    "role": "model",
-                    "parts": [model_part]
-                })
-                continue
+            }
+            if tc.get("thought_signature"):
+                model_part["thought_signature"] = tc["thought_signature"]
+                
+            return {
+                "role": "model",
+                "parts": [model_part]
+            }
 
-            # Tool result
-            if role == "tool" and "tool_result" in msg:
-                contents.append({
-                    "role": "user", # The SDK expects 'user' role for function responses in conversation history
-                    "parts": [{
-                        "function_response": {
-                            "name": msg["name"],
-                            "response": self._make_serializable(msg["tool_result"])
-                        }
-                    }]
-                })
-                continue
+        # Tool result
+        tool_result = msg.get("tool_result") if role == "tool" else None
+        if tool_result is not None:
+            return {
+                "role": "user", # The SDK expects 'user' role for function responses in conversation history
+                "parts": [{
+                    "function_response": {
+                        "name": msg["name"],
+                        "response": self._make_serializable(tool_result)
+                    }
+                }]
+            }
 
-            # Standard message (possibly multimodal)
-            role_map = {"user": "user", "assistant": "model", "model": "model"}
-            mapped_role = role_map.get(role, "user")
-            
-            parts = []
-            if "parts" in msg:
-                for p in msg["parts"]:
-                    if "text" in p:
-                        parts.append({"text": p["text"]})
-                    elif "file_path" in p:
-                        fpath = p["file_path"]
-                        file_bytes = read_file_bytes(fpath)
-                        if file_bytes is not None:
+        # Standard message (possibly multimodal)
+        mapped_role = _ROLE_MAP.get(role, "user")
+        
+        parts = []
+        msg_parts = msg.get("parts")
+        if msg_parts is not None:
+            for p in msg_parts:
+                if "text" in p:
+                    parts.append({"text": p["text"]})
+                elif "file_path" in p:
+                    fpath = p["file_path"]
+                    try:
+                        st = os.stat(fpath)
+                    except OSError:
+                        logger.warning(f"[GoogleProvider] File not found: {fpath}")
+                        parts.append({"text": f"[File Missing: {os.path.basename(fpath)}]"})
+                        continue
+                    if st.st_size > _INLINE_LIMIT_BYTES:
+                        uploaded = self._upload_file(fpath, st, p["mime_type"])
+                        if uploaded is not None:
                             parts.append({
-                                "inline_data": {
-                                    "mime_type": p["mime_type"],
-                                    "data": file_bytes
+                                "file_data": {
+                                    "file_uri": uploaded.uri,
+                                    "mime_type": p["mime_type"]
                                 }
                             })
                         else:
-                            parts.append({"text": f"[File Missing: {os.path.basename(fpath)}]"})
+                            # Too large to inline, so the request would be rejected
+                            parts.append({"text": f"[File Upload Failed: {os.path.basename(fpath)}]"})
+                        continue
+                    file_bytes = _read_file_cached(fpath, st.st_mtime_ns, st.st_size)
+                    if file_bytes is not None:
+                        parts.append({
+                            "inline_data": {
+                                "mime_type": p["mime_type"],
+                                "data": file_bytes
+                            }
+                        })
+                    else:
+                        parts.append({"text": f"[File Missing: {os.path.basename(fpath)}]"})
+        else:
+            parts.append({"text": msg["content"]})
+            
+        return {"role": mapped_role, "parts": parts}
+
+    def _upload_file(self, fpath: str, st: os.stat_result, mime_type: str) -> Optional[Any]:
+        """Uploads a large attachment through the File API, reusing the upload until it expires."""
+        key = (fpath, st.st_mtime_ns, st.st_size)
+        with self._uploaded_files_lock:
+            uploaded = self._uploaded_files.get(key)
+            if uploaded is not None:
+                expires = uploaded.expiration_time
+                if expires is None or expires > datetime.now().astimezone():
+                    self._uploaded_files.move_to_end(key)
+                    return uploaded
+                del self._uploaded_files[key]
+
+        try:
+            uploaded = self.client.files.upload(file=fpath, config={"mime_type": mime_type})
+            uploaded = self._wait_until_active(uploaded)
+        except Exception as e:
+            logger.error(f"[GoogleProvider] File upload failed for {fpath}: {e}")
+            return None
+        if uploaded is None:
+            logger.error(f"[GoogleProvider] Uploaded file {fpath} did not become ACTIVE")
+            return None
+
+        with self._uploaded_files_lock:
+            self._uploaded_files[key] = uploaded
+            self._uploaded_files.move_to_end(key)
+            while len(self._uploaded_files) > _UPLOADED_FILES_MAX:
+                self._uploaded_files.popitem(last=False)
+        return uploaded
+
+    def _wait_until_active(self, uploaded: Any) -> Optional[Any]:
+        """Polls an uploaded file until it leaves PROCESSING; None if it FAILED or the wait timed out."""
+        deadline = time.monotonic() + _UPLOAD_READY_TIMEOUT
+        while True:
+            state = getattr(uploaded.state, "name", uploaded.state)
+            if state != "PROCESSING":
+                return None if state == "FAILED" else uploaded
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(_UPLOAD_POLL_INTERVAL)
+            uploaded = self.client.files.get(name=uploaded.name)
+
+    def generate_response(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None,
+                          background: bool = False) -> Any:
+        if not self.client:
+            return "[Error: google-genai package not installed or API key missing]"
+        
+        # Convert internal message format to Google's contents format. History messages
+        # are the same dict objects from turn to turn, so converted entries are reused
+        # by identity and only new messages are converted (and their files read).
+        previous = self._contents_cache
+        current: Dict[int, tuple] = {}
+        contents = []
+        system_parts: List[str] = []
+        # Local bindings; this loop runs over the whole history on every turn
+        previous_get = previous.get
+        contents_append = contents.append
+        convert = self._convert_message
+        for msg in messages:
+            if msg["role"] == "system":
+                system_parts.append(msg["content"])
+                continue
+            key = id(msg)
+            cached = previous_get(key)
+            if cached is not None and cached[0] is msg:
+                entry = cached[1]
             else:
-                parts.append({"text": msg["content"]})
-                
-            contents.append({"role": mapped_role, "parts": parts})
+                entry = convert(msg)
+            # Holding msg keeps its id from being reused while the entry is cached
+            current[key] = (msg, entry)
+            contents_append(entry)
+        # Replaced rather than updated, so messages that left the history are dropped.
+        # Background calls only read it; they run alongside the main turn.
+        if not background:
+            self._contents_cache = current
         
-        # Find and combine all system messages
-        system_messages = [msg["content"] for msg in messages if msg["role"] == "system"]
-        system_instruction = "\n\n".join(system_messages) if system_messages else None
+        # Combine all system messages
+        system_instruction = "\n\n".join(system_parts) or None
+
+        # Get or create context cache; background calls use a different configuration
+        # and would replace the main conversation's cache
+        cached_content = None if background else self._get_or_create_cache(system_instruction, tools)
+        
+        # Prepare config with tools if provided (if not using cache)
+        config: Dict[str, Any] = {}
+        if cached_content:
+            config["cached_content"] = cached_content.name
+        else:
+            if system_instruction:
+                config["system_instruction"] = system_instruction
+            if tools:
+                config["tools"] = [{"function_declarations": tools}]
 
         max_retries = 3
-        retry_delay = 5
         
         for attempt in range(max_retries + 1):
             try:
-                # Get or create context cache
-                cached_content = self._get_or_create_cache(system_instruction, tools)
-                
-                # Prepare config with tools if provided (if not using cache)
-                config: Dict[str, Any] = {}
-                if cached_content:
-                    config["cached_content"] = cached_content.name
-                else:
-                    if system_instruction:
-                        config["system_instruction"] = system_instruction
-                    if tools:
-                        config["tools"] = [{"function_declarations": tools}]
-
                 response = self.client.models.generate_content(
                     model=self.model_name,
                     contents=contents,
@@ -142,7 +316,7 @@ class GoogleProvider(Provider):
                 )
                 
                 # Store usage metadata
-                if response.usage_metadata:
+                if response.usage_metadata and not background:
                     self.last_usage = {
                         "prompt_tokens": response.usage_metadata.prompt_token_count,
                         "candidates_tokens": response.usage_metadata.candidates_token_count,
@@ -165,15 +339,16 @@ class GoogleProvider(Provider):
                     
                 return response.text
             except Exception as e:
-                # Check for specific error types if needed, or handle general exceptions gracefully
-                # If it's a ServerError, we retry. Otherwise, we might want to fail immediately.
+                # Client errors other than rate limiting (429) fail the same way on retry.
+                # Server errors, 429s and transport failures are retried.
                 error_str = str(e)
-                if "400" in error_str or "403" in error_str or "404" in error_str:
-                     return f"[Error from Google Provider: {error_str}]"
+                if isinstance(e, errors.ClientError) and e.code != 429:
+                    return f"[Error from Google Provider: {error_str}]"
                 
                 logger.error(f"[GoogleProvider] Attempt {attempt + 1} failed: {error_str}")
                 if attempt < max_retries:
-                    logger.info(f"[GoogleProvider] Retrying in {retry_delay} seconds...")
+                    retry_delay = _retry_delay(e, attempt)
+                    logger.info(f"[GoogleProvider] Retrying in {retry_delay:.1f} seconds...")
                     time.sleep(retry_delay)
                 else:
                     return f"[Error from Google Provider: All retries failed. Last error: {error_str}]"
@@ -186,6 +361,22 @@ class GoogleProvider(Provider):
     def supports_audio_parts(self) -> bool:
         return True
 
+    def _config_hash(self, system_instruction: Optional[str], tools: Optional[List[Dict[str, Any]]]) -> str:
+        """Fingerprints the cached configuration, serializing the tool list only when it is a new list."""
+        if self._tools_digest is not None and self._tools_digest[0] is tools:
+            tools_digest = self._tools_digest[1]
+        else:
+            tools_digest = hashlib.blake2b(_dumps_sorted(tools), digest_size=16).digest()
+            self._tools_digest = (tools, tools_digest)
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self.model_name.encode())
+        h.update(b"\0")
+        h.update((system_instruction or "").encode())
+        h.update(b"\0")
+        h.update(tools_digest)
+        return h.hexdigest()
+
     def _get_or_create_cache(self, system_instruction: Optional[str], tools: Optional[List[Dict[str, Any]]]) -> Optional[Any]:
         """Manages explicit context caching for system instructions and tools."""
         if not self.client or not (system_instruction or tools):
@@ -196,12 +387,7 @@ class GoogleProvider(Provider):
         # The API will handle the actual effectiveness.
         
         # Create a unique hash of the configuration to detect changes
-        config_data = {
-            "system_instruction": system_instruction,
-            "tools": tools,
-            "model": self.model_name
-        }
-        config_hash = hashlib.sha256(json.dumps(config_data, sort_keys=True).encode()).hexdigest()
+        config_hash = self._config_hash(system_instruction, tools)
 
         # If hash matches, return existing cache if it hasn't expired (simplified check)
         if self._cached_config_hash == config_hash and self._cached_content:
@@ -247,8 +433,7 @@ class GoogleProvider(Provider):
             logger.info(f"[GoogleProvider] Created new context cache: {new_cache.name}")
             return new_cache
         except Exception as e:
-            error_msg = str(e)
-            if "400" in error_msg and "too small" in error_msg.lower():
+            if isinstance(e, errors.ClientError) and e.code == 400 and "too small" in (e.message or "").lower():
                 # Silently ignore "too small" errors and mark this hash as non-cacheable
                 self._cached_config_hash = config_hash
                 self._cached_content = None
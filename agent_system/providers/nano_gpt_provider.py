@@ -1,15 +1,146 @@
-import base64
+import binascii
+import collections
+import functools
+import hashlib
 import json
+import mmap
+import os
+import random
+import threading
 import time
 from typing import List, Dict, Any, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
 
 from agent_system.core.provider import Provider
-from agent_system.providers.file_utils import read_file_bytes
 from agent_system.utils import logger
 
 
+def _dumps(obj: Any) -> bytes:
+    """Serializes obj to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson is stricter (e.g. non-string keys); fall back to the stdlib
+            pass
+    return json.dumps(obj, ensure_ascii=True).encode("ascii")
+
+
+# No retry is started if its backoff would end later than this after the first attempt
+_RETRY_BUDGET_SECONDS = 120.0
+
+# Attachments with this mime type prefix are sent inline as data URLs
+_IMAGE_MIME_PREFIX = "image/"
+
+# Read size when encoding attachments; a multiple of 3, so chunks encode without padding
+_ENCODE_CHUNK_BYTES = 3 * 64 * 1024
+
+# Attachments at least this large are mapped rather than read chunk by chunk
+_MMAP_MIN_BYTES = 1024 * 1024
+
+if pybase64 is not None:
+    # SIMD encoder
+    _b64encode = pybase64.b64encode
+else:
+    _b64encode = functools.partial(binascii.b2a_base64, newline=False)
+
+# Encoded images kept in memory; each entry is a whole base64 image
+_DATA_URL_CACHE_SIZE = 16
+
+# (content digest, mime type) -> data URL, so identical images under different paths
+# share one string
+_data_urls_by_digest: "collections.OrderedDict[tuple, str]" = collections.OrderedDict()
+_data_urls_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=_DATA_URL_CACHE_SIZE)
+def _encode_data_url(path: str, mtime_ns: int, size: int, mime_type: str) -> str:
+    """Builds an image's data URL once per (path, mtime, size); a changed file gets a new key.
+
+    The file is encoded chunk by chunk into one buffer, so the whole file and its
+    encoded copy are never held at the same time. Large files are memory-mapped and
+    encoded straight from the page cache, without copying each chunk into a bytes object.
+    Read errors propagate, so lru_cache never memoizes a failure.
+    """
+    buf = bytearray(f"data:{mime_type};base64,".encode("ascii"))
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size >= _MMAP_MIN_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+                for start in range(0, len(view), _ENCODE_CHUNK_BYTES):
+                    # Slices must be released before the map can close
+                    with view[start:start + _ENCODE_CHUNK_BYTES] as chunk:
+                        digest.update(chunk)
+                        buf += _b64encode(chunk)
+        else:
+            while True:
+                chunk = f.read(_ENCODE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                buf += _b64encode(chunk)
+
+    key = (digest.digest(), mime_type)
+    with _data_urls_lock:
+        data_url = _data_urls_by_digest.get(key)
+        if data_url is None:
+            data_url = buf.decode("ascii")
+            _data_urls_by_digest[key] = data_url
+            if len(_data_urls_by_digest) > _DATA_URL_CACHE_SIZE:
+                _data_urls_by_digest.popitem(last=False)
+        else:
+            _data_urls_by_digest.move_to_end(key)
+    return data_url
+
+
+def _image_data_url(path: str, mime_type: str) -> Optional[str]:
+    """Returns the data URL for an image attachment, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        logger.warning(f"[Provider] File not found: {path}")
+        return None
+    try:
+        return _encode_data_url(path, st.st_mtime_ns, st.st_size, mime_type)
+    except Exception as e:
+        # Not cached: a transient error (permissions, EIO) is retried on the next turn
+        logger.error(f"[Provider] Error reading file {path}: {e}")
+        return None
+
+
+def _retry_delay(attempt: int, response: Optional[requests.Response] = None) -> float:
+    """Seconds to wait before the next attempt: the server's Retry-After when it sends one,
+    otherwise exponential backoff from three seconds with full jitter."""
+    if response is not None:
+        try:
+            return min(float(response.headers.get("Retry-After")), 60.0)
+        except (TypeError, ValueError):
+            # Missing, or an HTTP date rather than a number of seconds
+            pass
+    return min(30.0, 3 * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def _loads_response(response: requests.Response) -> Any:
+    """Decodes a JSON response body, using orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            # Let requests raise its own error type, which the retry loop handles
+            pass
+    return response.json()
+
+
 class NanoGPTProvider(Provider):
     """Implementation of the NanoGPT OpenAI-compatible API provider."""
 
@@ -31,11 +162,28 @@ class NanoGPTProvider(Provider):
             "candidates_tokens": 0,
             "total_tokens": 0,
         }
+        # (tools list, normalized schemas, their JSON bytes); the engine passes the same list every turn
+        self._normalized_tools: Optional[tuple] = None
+
+        # Pooled keep-alive connections, so turns after the first skip the TCP and TLS handshakes.
+        # Retries are handled in generate_response, not by the adapter.
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        })
 
     def _normalize_tool_schema(self, tool: Dict[str, Any]) -> Dict[str, Any]:
         """Convert internal tool schema to OpenAI-compatible tool schema."""
         parameters = tool.get("parameters", {})
-        normalized_params = self._normalize_json_schema(parameters)
+        # Most schemas already use lowercase types; those are sent as they are
+        if self._schema_needs_normalizing(parameters):
+            normalized_params = self._normalize_json_schema(parameters)
+        else:
+            normalized_params = parameters
         return {
             "type": "function",
             "function": {
@@ -45,6 +193,20 @@ class NanoGPTProvider(Provider):
             },
         }
 
+    def _schema_needs_normalizing(self, schema: Any) -> bool:
+        """Returns True if _normalize_json_schema would change schema, without copying it."""
+        if isinstance(schema, dict):
+            for key, value in schema.items():
+                if key == "type" and isinstance(value, str):
+                    if value != value.lower():
+                        return True
+                elif self._schema_needs_normalizing(value):
+                    return True
+            return False
+        if isinstance(schema, list):
+            return any(self._schema_needs_normalizing(item) for item in schema)
+        return False
+
     def _normalize_json_schema(self, schema: Any) -> Any:
         if isinstance(schema, dict):
             normalized = {}
@@ -62,34 +224,43 @@ class NanoGPTProvider(Provider):
         if isinstance(tool_result, str):
             return tool_result
         try:
-            return json.dumps(tool_result, ensure_ascii=True)
+            return _dumps(tool_result).decode("utf-8")
         except Exception:
             return str(tool_result)
 
     def _build_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         openai_messages: List[Dict[str, Any]] = []
-        pending_tool_calls: List[Dict[str, str]] = []
+        # Unanswered calls, oldest first, per tool name and overall. Each call is a
+        # [call_id, answered] cell shared by both queues: a call answered through one
+        # queue is left in the other and skipped when it reaches the front. Ids are not
+        # unique (some backends reuse "call_0" every turn), so the cell is the identity.
+        pending_by_name: Dict[Any, collections.deque] = collections.defaultdict(collections.deque)
+        pending_fifo: collections.deque = collections.deque()
         call_index = 1
+        # Local bindings; this runs over the whole history on every turn
+        append = openai_messages.append
 
         for msg in messages:
             role = msg.get("role")
             if role == "system":
-                openai_messages.append({"role": "system", "content": msg.get("content", "")})
+                append({"role": "system", "content": msg.get("content", "")})
                 continue
 
             if role == "model" and "tool_call" in msg:
                 tc = msg["tool_call"]
                 call_id = tc.get("id") or f"call_{call_index}"
                 call_index += 1
-                pending_tool_calls.append({"id": call_id, "name": tc.get("name")})
-                openai_messages.append({
+                cell = [call_id, False]
+                pending_by_name[tc.get("name")].append(cell)
+                pending_fifo.append(cell)
+                append({
                     "role": "assistant",
                     "tool_calls": [{
                         "id": call_id,
                         "type": "function",
                         "function": {
                             "name": tc.get("name"),
-                            "arguments": json.dumps(tc.get("args", {}), ensure_ascii=True),
+                            "arguments": _dumps(tc.get("args", {})).decode("utf-8"),
                         },
                     }],
                 })
@@ -98,16 +269,18 @@ class NanoGPTProvider(Provider):
             if role == "tool" and "tool_result" in msg:
                 tool_name = msg.get("name")
                 tool_call_id = None
-                for idx, pending in enumerate(pending_tool_calls):
-                    if tool_name is None or pending["name"] == tool_name:
-                        tool_call_id = pending["id"]
-                        pending_tool_calls.pop(idx)
+                queue = pending_fifo if tool_name is None else pending_by_name.get(tool_name)
+                while queue:
+                    cell = queue.popleft()
+                    if not cell[1]:
+                        cell[1] = True
+                        tool_call_id = cell[0]
                         break
                 if tool_call_id is None:
                     tool_call_id = f"call_{call_index}"
                     call_index += 1
 
-                openai_messages.append({
+                append({
                     "role": "tool",
                     "tool_call_id": tool_call_id,
                     "content": self._serialize_tool_result(msg.get("tool_result")),
@@ -115,36 +288,39 @@ class NanoGPTProvider(Provider):
                 continue
 
             mapped_role = "assistant" if role in ("assistant", "model") else "user"
-            if "parts" in msg:
+            msg_parts = msg.get("parts")
+            if msg_parts is not None:
                 content_parts = []
-                for part in msg["parts"]:
+                add_part = content_parts.append
+                for part in msg_parts:
                     if "text" in part:
-                        content_parts.append({"type": "text", "text": part["text"]})
+                        add_part({"type": "text", "text": part["text"]})
                     elif "file_path" in part:
-                        file_bytes = read_file_bytes(part["file_path"])
-                        if file_bytes is None:
-                            content_parts.append({
+                        file_path = part["file_path"]
+                        mime_type = part.get("mime_type", "application/octet-stream")
+                        if mime_type.startswith(_IMAGE_MIME_PREFIX):
+                            data_url = _image_data_url(file_path, mime_type)
+                            if data_url is not None:
+                                add_part({
+                                    "type": "image_url",
+                                    "image_url": {"url": data_url},
+                                })
+                                continue
+                        elif os.path.exists(file_path):
+                            add_part({
                                 "type": "text",
-                                "text": f"[File Missing: {part.get('file_path', '')}]",
+                                "text": f"[File uploaded: {file_path} ({mime_type})]",
                             })
                             continue
-                        mime_type = part.get("mime_type", "application/octet-stream")
-                        if mime_type.startswith("image/"):
-                            b64 = base64.b64encode(file_bytes).decode("ascii")
-                            data_url = f"data:{mime_type};base64,{b64}"
-                            content_parts.append({
-                                "type": "image_url",
-                                "image_url": {"url": data_url},
-                            })
                         else:
-                            filename = part.get("file_path", "")
-                            content_parts.append({
-                                "type": "text",
-                                "text": f"[File uploaded: {filename} ({mime_type})]",
-                            })
-                openai_messages.append({"role": mapped_role, "content": content_parts})
+                            logger.warning(f"[Provider] File not found: {file_path}")
+                        add_part({
+                            "type": "text",
+                            "text": f"[File Missing: {file_path}]",
+                        })
+                append({"role": mapped_role, "content": content_parts})
             else:
-                openai_messages.append({"role": mapped_role, "content": msg.get("content", "")})
+                append({"role": mapped_role, "content": msg.get("content", "")})
 
         return openai_messages
 
@@ -176,14 +352,11 @@ class NanoGPTProvider(Provider):
         self,
         messages: List[Dict[str, Any]],
         tools: Optional[List[Dict[str, Any]]] = None,
+        background: bool = False,
     ) -> Any:
         if not self.api_key:
             return "[Error: NANOGPT_API_KEY is missing]"
 
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
         url = f"{self.base_url}/v1/chat/completions"
 
         payload: Dict[str, Any] = {
@@ -191,37 +364,52 @@ class NanoGPTProvider(Provider):
             "messages": self._build_messages(messages),
         }
 
+        # Serialized once, not again by requests on every retry; bytes passed as data=
+        # are sent as-is with Content-Length, and Content-Type is set on the session
+        body = b'{"model":' + _dumps(self.model_name) + b',"messages":' + _dumps(payload["messages"])
+
         if tools:
-            payload["tools"] = [self._normalize_tool_schema(t) for t in tools]
+            if self._normalized_tools is None or self._normalized_tools[0] is not tools:
+                normalized = [self._normalize_tool_schema(t) for t in tools]
+                self._normalized_tools = (tools, normalized, _dumps(normalized))
+            payload["tools"] = self._normalized_tools[1]
             payload["tool_choice"] = "auto"
+            # The tool schemas are spliced in pre-encoded rather than re-serialized every turn
+            body += b',"tools":' + self._normalized_tools[2] + b',"tool_choice":"auto"'
+
+        body += b"}"
 
         max_retries = 3
-        retry_delay = 3
+        deadline = time.monotonic() + _RETRY_BUDGET_SECONDS
 
         for attempt in range(max_retries + 1):
             try:
-                response = requests.post(url, headers=headers, json=payload, timeout=self.timeout_seconds)
+                response = self.session.post(url, data=body, timeout=self.timeout_seconds)
                 if response.status_code >= 400:
                     try:
-                        error_data = response.json()
+                        error_data = _loads_response(response)
                         error_msg = error_data.get("error", {}).get("message") or response.text
                     except Exception:
                         error_msg = response.text
 
+                    if response.status_code in (429, 500, 502, 503, 504) and attempt < max_retries:
+                        retry_delay = _retry_delay(attempt, response)
+                        if time.monotonic() + retry_delay <= deadline:
+                            logger.warning(f"[NanoGPTProvider] Retryable error {response.status_code}: {error_msg}. Retrying in {retry_delay:.1f}s...")
+                            time.sleep(retry_delay)
+                            continue
+
+                    # Only the error that is returned carries the request summary
                     if self.debug_log_requests:
                         debug_info = self._build_request_debug(payload)
                         error_msg = f"{error_msg}\n\nRequest Debug:\n```text\n{debug_info}\n```"
 
-                    if response.status_code in (429, 500, 502, 503, 504) and attempt < max_retries:
-                        logger.warning(f"[NanoGPTProvider] Retryable error {response.status_code}: {error_msg}")
-                        time.sleep(retry_delay)
-                        continue
-
                     return f"[Error from NanoGPT Provider: {response.status_code} {error_msg}]"
 
-                data = response.json()
+                data = _loads_response(response)
                 usage = data.get("usage", {})
-                if usage:
+                # Background calls run alongside the main turn and must not overwrite its usage
+                if usage and not background:
                     self.last_usage = {
                         "prompt_tokens": usage.get("prompt_tokens", 0),
                         "candidates_tokens": usage.get("completion_tokens", 0),
@@ -251,9 +439,11 @@ class NanoGPTProvider(Provider):
                 return message.get("content", "")
             except requests.RequestException as e:
                 if attempt < max_retries:
-                    logger.warning(f"[NanoGPTProvider] Request failed: {e}. Retrying in {retry_delay}s...")
-                    time.sleep(retry_delay)
-                    continue
+                    retry_delay = _retry_delay(attempt)
+                    if time.monotonic() + retry_delay <= deadline:
+                        logger.warning(f"[NanoGPTProvider] Request failed: {e}. Retrying in {retry_delay:.1f}s...")
+                        time.sleep(retry_delay)
+                        continue
                 return f"[Error from NanoGPT Provider: {str(e)}]"
 
         return "[Error from NanoGPT Provider: Unknown failure]"
@@ -1,6 +1,9 @@
+import atexit
 import logging
 import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 # Base directory of the project
@@ -10,10 +13,17 @@ BASE_DIR = Path(__file__).parent.parent.parent
 LOG_DIR = BASE_DIR / "log"
 LOG_FILE = LOG_DIR / "agent.log"
 
+# Rotation limits for LOG_FILE
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+# Writes queued records to the file on a background thread
+_listener = None
+
 def setup_logger():
     """Sets up the centralized logger."""
-    if not LOG_DIR.exists():
-        os.makedirs(LOG_DIR, exist_ok=True)
+    global _listener
+    os.makedirs(LOG_DIR, exist_ok=True)
 
     logger = logging.getLogger("agent_system")
     logger.setLevel(logging.INFO)
@@ -24,21 +34,29 @@ def setup_logger():
     # Clear existing handlers to avoid duplicates if re-initialized
     if logger.hasHandlers():
         logger.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
 
-    # File handler
-    file_handler = logging.FileHandler(LOG_FILE)
+    # File handler, rotated so the log cannot grow without bound
+    file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
     file_handler.setLevel(logging.INFO)
     
     # Formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(formatter)
 
-    logger.addHandler(file_handler)
+    # Callers only enqueue the record; the listener thread does the file IO
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    logger.addHandler(QueueHandler(log_queue))
     
     return logger
 
 # Singleton-like instance
 logger = setup_logger()
+# Flush queued records on exit
+atexit.register(lambda: _listener.stop())
 
 def info(msg, *args, **kwargs):
     logger.info(msg, *args, **kwargs)
@@ -1,18 +1,53 @@
+import http.client
 import os
+import socket
 import sys
-import docker
 from dotenv import load_dotenv
 from agent_system.core.engine import Engine
-from agent_system.providers.google_provider import GoogleProvider
-from agent_system.providers.nano_gpt_provider import NanoGPTProvider
 from agent_system.channels.terminal_channel import TerminalChannel
 from agent_system.utils import logger
 from utils.persistence import Persistence
 from utils.config import load_config
 
+DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
+
+def _ping_docker_socket() -> bool:
+    """Pings the daemon over its Unix socket, skipping the Docker SDK's client setup.
+    Returns False when there is no local socket to try or the ping fails."""
+    docker_host = os.getenv("DOCKER_HOST", "")
+    if docker_host:
+        if not docker_host.startswith("unix://"):
+            return False
+        socket_path = docker_host[len("unix://"):]
+    else:
+        socket_path = DEFAULT_DOCKER_SOCKET
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(socket_path):
+        return False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn = http.client.HTTPConnection("localhost", timeout=2)
+    try:
+        sock.settimeout(2)
+        sock.connect(socket_path)
+        conn.sock = sock
+        conn.request("GET", "/_ping")
+        return conn.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        # Unreachable, or something other than Docker answered on the socket
+        return False
+    finally:
+        conn.close()
+        sock.close()
+
 def check_docker():
     """Checks if the Docker daemon is running."""
+    if _ping_docker_socket():
+        logger.info("Docker daemon is running.")
+        return
+    # The SDK is only imported when the socket ping could not answer
+    import docker
     try:
+        # Remote or Windows daemons, or a failed socket ping: let the SDK decide and report
         client = docker.from_env()
         client.ping()
         logger.info("Docker daemon is running.")
@@ -36,10 +71,13 @@ def main():
     api_key = os.getenv("GOOGLE_API_KEY")
     provider_name = config.get("provider", "google")
     
+    # Only the selected provider's module and SDK are imported
     if provider_name == "google":
+        from agent_system.providers.google_provider import GoogleProvider
         model_name = config.get("google", {}).get("model", "gemini-3-flash-preview")
         provider = GoogleProvider(api_key=api_key, model_name=model_name)
     elif provider_name == "nano_gpt":
+        from agent_system.providers.nano_gpt_provider import NanoGPTProvider
         nano_api_key = os.getenv("NANOGPT_API_KEY")
         nano_config = config.get("nano_gpt", {})
         model_name = nano_config.get("model", "gpt-4o-mini")
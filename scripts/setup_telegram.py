@@ -40,17 +40,26 @@ def main():
         timeout = 60 # 60 seconds timeout
         start_time = time.time()
         while time.time() - start_time < timeout:
-            resp = requests.get(f"https://api.telegram.org/bot{token}/getUpdates", params={"offset": offset, "timeout": 5}).json()
-            if resp.get("ok") and resp.get("result"):
-                for update in resp["result"]:
-                    if "message" in update:
-                        chat_id = update["message"]["chat"]["id"]
-                        user_name = update["message"]["from"].get("username", update["message"]["from"].get("first_name", "User"))
-                        print(f"\nReceived message from {user_name} (Chat ID: {chat_id})")
-                        break
-                if chat_id:
+            # Long poll: Telegram holds the request open until a message arrives
+            poll_seconds = max(1, min(25, int(timeout - (time.time() - start_time))))
+            resp = requests.get(
+                f"https://api.telegram.org/bot{token}/getUpdates",
+                params={"offset": offset, "timeout": poll_seconds},
+                timeout=poll_seconds + 5,
+            ).json()
+            if not resp.get("ok"):
+                # Avoid a busy loop if the API keeps refusing the poll
+                time.sleep(1)
+            for update in resp.get("result") or []:
+                # Acknowledge every update so it is not sent again
+                offset = update["update_id"] + 1
+                if "message" in update:
+                    chat_id = update["message"]["chat"]["id"]
+                    user_name = update["message"]["from"].get("username", update["message"]["from"].get("first_name", "User"))
+                    print(f"\nReceived message from {user_name} (Chat ID: {chat_id})")
                     break
-            time.sleep(1)
+            if chat_id:
+                break
             print(".", end="", flush=True)
     except KeyboardInterrupt:
         print("\nInterrupted.")
@@ -78,10 +87,19 @@ def main():
         current_env["TELEGRAM_BOT_TOKEN"] = token
         current_env["TELEGRAM_CHAT_ID"] = str(chat_id)
         
-        with open(env_path, "w") as f:
-            for k, v in current_env.items():
-                f.write(f"{k}={v}\n")
-        
+        # Written to a temp file and renamed over .env, so a crash never leaves it truncated
+        buf = "".join(f"{k}={v}\n" for k, v in current_env.items()).encode("utf-8")
+        tmp_path = env_path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(fd, view):]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, env_path)
+
         print(f"Successfully updated {env_path}")
 
         # Update config.json to include "telegram" channel
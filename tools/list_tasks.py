@@ -1,5 +1,7 @@
 from agent_system.utils import logger
 
+_SEPARATOR = "-" * 20 + "\n"
+
 SCHEMA = {
     "name": "list_tasks",
     "description": "Lists all scheduled tasks.",
@@ -20,17 +22,19 @@ def execute(args):
         if not tasks:
             return "No scheduled tasks found."
 
-        output = "Scheduled Tasks:\n"
+        parts = ["Scheduled Tasks:\n"]
         for task in tasks:
-            output += f"- ID: {task.id}\n"
-            output += f"  Prompt: {task.prompt}\n"
-            output += f"  Channel: {task.channel_name}\n"
-            output += f"  Trigger: {task.trigger_type} = {task.trigger_value}\n"
-            output += f"  Next Run: {task.next_run}\n"
-            output += f"  Session: {task.session_file}\n"
-            output += "-" * 20 + "\n"
+            parts.append(
+                f"- ID: {task.id}\n"
+                f"  Prompt: {task.prompt}\n"
+                f"  Channel: {task.channel_name}\n"
+                f"  Trigger: {task.trigger_type} = {task.trigger_value}\n"
+                f"  Next Run: {task.next_run}\n"
+                f"  Session: {task.session_file}\n"
+                f"{_SEPARATOR}"
+            )
         
-        return output
+        return "".join(parts)
             
     except Exception as e:
         logger.error(f"Error listing tasks: {e}")
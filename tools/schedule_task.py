@@ -1,6 +1,11 @@
+import re
 from datetime import datetime, timedelta
 from agent_system.utils import logger
 
+# Relative times like "in 5 minutes" or "in 1 hour"
+_RELATIVE_RE = re.compile(r"in\s+(\d+)\s+(second|minute|hour|day)s?", re.IGNORECASE)
+_UNIT_KWARG = {"second": "seconds", "minute": "minutes", "hour": "hours", "day": "days"}
+
 SCHEMA = {
     "name": "schedule_task",
     "description": "Schedules a task so the agent later receives the scheduled prompt to act on at a specific time or recurrently.",
@@ -43,44 +48,34 @@ def execute(args):
         # So scheduler.persistence.session_file IS the current session file.
         session_file = scheduler.persistence.session_file
         
+        # Due time of an 'at' task, parsed once here and handed to the scheduler as is
+        next_run = None
         if cron:
             trigger_type = 'cron'
             trigger_value = cron
         elif when:
             trigger_type = 'at'
             # Simple parsing for MVP
-            if when.lower().startswith("in "):
-                # Parse relative "in X minutes/seconds/hours"
-                parts = when.lower()[3:].strip().split()
-                if len(parts) >= 2:
-                    amount = int(parts[0])
-                    unit = parts[1]
-                    now = datetime.now()
-                    if "minute" in unit:
-                        dt = now + timedelta(minutes=amount)
-                    elif "hour" in unit:
-                        dt = now + timedelta(hours=amount)
-                    elif "second" in unit:
-                        dt = now + timedelta(seconds=amount)
-                    elif "day" in unit:
-                        dt = now + timedelta(days=amount)
-                    else:
-                        return f"Error: Unsupported time unit in '{when}'."
-                    trigger_value = dt.isoformat()
-                else:
-                     return f"Error: Could not parse relative time '{when}'."
+            if when[:3].lower() == "in ":
+                # Parse relative "in X seconds/minutes/hours/days"
+                match = _RELATIVE_RE.fullmatch(when.strip())
+                if not match:
+                    return f"Error: Could not parse relative time '{when}'. Use 'in X seconds/minutes/hours/days'."
+                delta = timedelta(**{_UNIT_KWARG[match.group(2).lower()]: int(match.group(1))})
+                next_run = datetime.now() + delta
+                trigger_value = next_run.isoformat()
             else:
                 # Assume ISO
-                # Verify format
                 try:
-                    datetime.fromisoformat(when)
+                    next_run = datetime.fromisoformat(when)
                     trigger_value = when
                 except ValueError:
                     return f"Error: Invalid date format '{when}'. Use ISO 8601 or 'in X minutes'."
         else:
             return "Error: Must provide either 'when' or 'cron'."
 
-        task = scheduler.add_task(prompt, session_file, trigger_type, trigger_value, channel_name=channel_name)
+        task = scheduler.add_task(prompt, session_file, trigger_type, trigger_value, channel_name=channel_name,
+                                  next_run=next_run)
         
         return f"Task scheduled successfully. ID: {task.id}. Next run: {task.next_run}"
 
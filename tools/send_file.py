@@ -1,5 +1,6 @@
 import os
 import shutil
+import stat
 import time
 
 from agent_system.utils import logger
@@ -33,8 +34,7 @@ SCHEMA = {
 
 
 def _resolve_path(workspace_dir: str, file_path: str) -> str:
-    if os.path.isabs(file_path):
-        return os.path.abspath(file_path)
+    # join() keeps file_path as is when it is absolute
     return os.path.abspath(os.path.join(workspace_dir, file_path))
 
 
@@ -50,34 +50,45 @@ def execute(params: dict) -> str:
     if not file_path:
         return "Error: file_path is required."
 
-    resolved_path = _resolve_path(workspace_dir, file_path)
     workspace_dir = os.path.abspath(workspace_dir)
+    resolved_path = _resolve_path(workspace_dir, file_path)
 
     if not resolved_path.startswith(workspace_dir + os.path.sep):
         return "Error: file_path must be inside the workspace."
 
-    if not os.path.exists(resolved_path) or not os.path.isfile(resolved_path):
+    # One stat answers both "exists" and "is a regular file"
+    try:
+        st = os.stat(resolved_path)
+    except OSError:
+        return f"Error: File not found: {file_path}"
+    if not stat.S_ISREG(st.st_mode):
         return f"Error: File not found: {file_path}"
 
     output_dir = os.path.join(workspace_dir, "output")
     os.makedirs(output_dir, exist_ok=True)
 
     dest_name = output_name or os.path.basename(resolved_path)
-    dest_path = os.path.join(output_dir, dest_name)
+    dest_path = os.path.normpath(os.path.join(output_dir, dest_name))
 
-    if os.path.abspath(resolved_path) == os.path.abspath(dest_path):
+    if resolved_path == dest_path:
         return f"File already queued for delivery: {dest_name}"
 
-    if os.path.exists(dest_path):
+    if os.path.lexists(dest_path):
         base, ext = os.path.splitext(dest_name)
         dest_name = f"{base}_{int(time.time())}{ext}"
         dest_path = os.path.join(output_dir, dest_name)
 
     try:
         if mode == "copy":
+            # copy2 already uses the kernel fast path (sendfile) where available
             shutil.copy2(resolved_path, dest_path)
         else:
-            shutil.move(resolved_path, dest_path)
+            try:
+                # output/ normally sits on the same filesystem, making this a metadata-only rename
+                os.rename(resolved_path, dest_path)
+            except OSError:
+                # e.g. a workspace subdirectory mounted from another device
+                shutil.move(resolved_path, dest_path)
         logger.info(f"[Tool: send_file] Queued file for delivery: {dest_path}")
         return f"Queued file for delivery: {dest_name}"
     except Exception as e:
@@ -1,10 +1,17 @@
+import functools
 import os
 import wave
 import time
 import platform
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 import requests
 from piper import PiperVoice
 from agent_system.utils import logger
+from utils.config import env_number
 
 # Default model configuration
 DEFAULT_MODEL_NAME = "en_US-lessac-medium"
@@ -15,14 +22,26 @@ DEFAULT_VOICE_BY_LANGUAGE = {
     "en_US": "en_US-lessac-medium",
 }
 
+# Loaded voices by model path, most recently used last; each load builds an ONNX session
+_VOICE_CACHE_MAX = env_number("PIPER_VOICE_CACHE_MAX", 2, minimum=1, cast=int)
+_VOICE_CACHE: "OrderedDict[str, PiperVoice]" = OrderedDict()
+_VOICE_CACHE_LOCK = threading.Lock()
+
+# Copy buffer for model downloads; voice models are tens of MB
+_DOWNLOAD_BUFFER_BYTES = 1024 * 1024
+
+# Shared so the model and config downloads reuse pooled connections to the same host
+_SESSION = requests.Session()
+
 def download_file(url: str, dest_path: str):
     """Downloads a file from a URL to a destination path."""
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-    with open(dest_path, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
+    with _SESSION.get(url, stream=True) as response:
+        response.raise_for_status()
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # Read the raw stream in large blocks; decode_content still undoes any gzip/deflate
+        response.raw.decode_content = True
+        with open(dest_path, "wb") as f:
+            shutil.copyfileobj(response.raw, f, _DOWNLOAD_BUFFER_BYTES)
 
 # The SCHEMA for the Google GenAI tool definition
 SCHEMA = {
@@ -61,6 +80,7 @@ def _resolve_voice_name(voice_name: str, language: str) -> str:
         return DEFAULT_VOICE_BY_LANGUAGE.get(language, "")
     return DEFAULT_MODEL_NAME
 
+@functools.lru_cache(maxsize=64)
 def _voice_urls(voice_name: str) -> tuple[str, str]:
     parts = voice_name.split("-")
     if len(parts) < 3:
@@ -74,6 +94,24 @@ def _voice_urls(voice_name: str) -> tuple[str, str]:
     base = f"{MODEL_BASE_URL}/{language}/{locale}/{voice}/{quality}/{voice_name}"
     return f"{base}.onnx", f"{base}.onnx.json"
 
+def _get_voice(model_path: str) -> PiperVoice:
+    """Returns a cached PiperVoice for model_path, loading it on first use."""
+    with _VOICE_CACHE_LOCK:
+        voice = _VOICE_CACHE.get(model_path)
+        if voice is None:
+            voice = PiperVoice.load(model_path)
+            _VOICE_CACHE[model_path] = voice
+            if len(_VOICE_CACHE) > _VOICE_CACHE_MAX:
+                _VOICE_CACHE.popitem(last=False)
+        else:
+            _VOICE_CACHE.move_to_end(model_path)
+        return voice
+
+def _synthesize_iter(voice: PiperVoice, text: str) -> Iterator[bytes]:
+    """Yields 16-bit PCM audio as Piper produces it, one chunk per sentence."""
+    for chunk in voice.synthesize(text):
+        yield chunk.audio_int16_bytes
+
 def execute(params: dict) -> str:
     """Executes the text-to-speech tool."""
     text = params.get("text")
@@ -114,21 +152,28 @@ def execute(params: dict) -> str:
             model_url, config_url = _voice_urls(voice_name)
 
             # Check and download model if missing
+            missing = []
             if not os.path.exists(model_path):
                 logger.info(f"[Tool: text_to_speech] Downloading model {voice_name}.onnx...")
-                download_file(model_url, model_path)
+                missing.append((model_url, model_path))
 
             if not os.path.exists(config_path):
                 logger.info(f"[Tool: text_to_speech] Downloading config {voice_name}.onnx.json...")
-                download_file(config_url, config_path)
+                missing.append((config_url, config_path))
+
+            # The small config download overlaps the model download instead of waiting for it
+            if len(missing) > 1:
+                with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                    list(pool.map(lambda item: download_file(*item), missing))
+            elif missing:
+                download_file(*missing[0])
 
         # 3. Speech Synthesis
-        voice = PiperVoice.load(model_path)
+        voice = _get_voice(model_path)
         
         # Ensure output directory exists within workspace
         output_dir = os.path.join(workspace_dir, "output")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
             
         full_output_path = os.path.join(output_dir, output_filename)
         
@@ -136,8 +181,9 @@ def execute(params: dict) -> str:
             wav_file.setnchannels(1)
             wav_file.setsampwidth(2) # 16-bit
             wav_file.setframerate(voice.config.sample_rate)
-            for chunk in voice.synthesize(text):
-                wav_file.writeframes(chunk.audio_int16_bytes)
+            # Each sentence is written as soon as it is synthesized
+            for audio in _synthesize_iter(voice, text):
+                wav_file.writeframes(audio)
             
         logger.info(f"[Tool: text_to_speech] Audio saved to {full_output_path}")
         
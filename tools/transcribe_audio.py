@@ -1,6 +1,14 @@
 import os
+import threading
+from collections import OrderedDict
 from faster_whisper import WhisperModel
 from agent_system.utils import logger
+from utils.config import env_number
+
+# Loaded models, most recently used last; loading one takes seconds and hundreds of MB
+_MODEL_CACHE_MAX = env_number("WHISPER_CACHE_MAX", 2, minimum=1, cast=int)
+_MODEL_CACHE: "OrderedDict[str, WhisperModel]" = OrderedDict()
+_MODEL_CACHE_LOCK = threading.Lock()
 
 # The SCHEMA for the Google GenAI tool definition
 SCHEMA = {
@@ -29,6 +37,21 @@ SCHEMA = {
     }
 }
 
+def _get_model(model_size: str) -> WhisperModel:
+    """Returns a cached WhisperModel for model_size, loading it on first use."""
+    # Loading happens under the lock so concurrent calls never load the same model twice
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get(model_size)
+        if model is None:
+            # Load model on CPU (optimized for low-spec systems)
+            model = WhisperModel(model_size, device="cpu", compute_type="int8")
+            _MODEL_CACHE[model_size] = model
+            if len(_MODEL_CACHE) > _MODEL_CACHE_MAX:
+                _MODEL_CACHE.popitem(last=False)
+        else:
+            _MODEL_CACHE.move_to_end(model_size)
+        return model
+
 def execute(params: dict) -> str:
     """Executes the transcription tool."""
     audio_filename = params.get("audio_file")
@@ -45,9 +68,8 @@ def execute(params: dict) -> str:
 
     try:
         logger.info(f"[Tool: transcribe_audio] Starting transcription of {audio_filename} using {model_size} model...")
-        
-        # Load model on CPU (optimized for low-spec systems)
-        model = WhisperModel(model_size, device="cpu", compute_type="int8")
+
+        model = _get_model(model_size)
         
         transcribe_kwargs = {"beam_size": 5}
         if language:
@@ -55,9 +77,10 @@ def execute(params: dict) -> str:
 
         segments, info = model.transcribe(audio_path, **transcribe_kwargs)
         
-        transcription = ""
-        for segment in segments:
-            transcription += f"[{segment.start:.2f}s - {segment.end:.2f}s] {segment.text}\n"
+        # segments is a generator; lines are collected and joined once
+        transcription = "".join(
+            f"[{segment.start:.2f}s - {segment.end:.2f}s] {segment.text}\n" for segment in segments
+        )
             
         if not transcription.strip():
             return "Transcription completed, but no speech was detected."
@@ -1,8 +1,32 @@
 import json
+import math
 import os
 
+from agent_system.utils import logger
+
 def load_config(config_path: str = "config.json") -> dict:
     if os.path.exists(config_path):
         with open(config_path, "r", encoding="utf-8") as f:
             return json.load(f)
     return {}
+
+def env_number(name: str, default, minimum, cast=float):
+    """Reads a numeric setting from the environment without failing at import time.
+
+    Unset or empty values give default, malformed ones log a warning and give default,
+    and values below minimum are raised to it.
+    """
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        value = None
+    if value is None or not math.isfinite(value):
+        logger.warning(f"[Config] Invalid {name}={raw!r}, using {default}")
+        return default
+    if value < minimum:
+        logger.warning(f"[Config] {name}={raw!r} is below {minimum}, using {minimum}")
+        return minimum
+    return value
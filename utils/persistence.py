@@ -3,6 +3,7 @@ import os
 from datetime import datetime
 from typing import List, Dict, Optional, Any
 import base64
+from binascii import b2a_base64
 
 class Persistence:
     """Handles session persistence using JSONL files."""
@@ -14,6 +15,18 @@ class Persistence:
         self.memory_dir = memory_dir
         os.makedirs(self.sessions_dir, exist_ok=True)
         os.makedirs(self.memory_dir, exist_ok=True)
+        # In-memory copy of the current session's messages, valid while session_file is unchanged
+        self._history_cache: Optional[List[Dict[str, Any]]] = None
+        self._history_cache_file: Optional[str] = None
+        # Whether the session file in _has_title_file has a title, known without re-reading it
+        self._has_title_cache: Optional[bool] = None
+        self._has_title_file: Optional[str] = None
+        # Sorted session filenames and their indices, keyed by the sessions dir mtime
+        self._session_files_mtime: Optional[int] = None
+        self._session_files: List[str] = []
+        self._filename_index: Dict[str, int] = {}
+        # Session files held open for appending while a write batch is open
+        self._batch_files: Optional[Dict[str, Any]] = None
         
         latest = self._get_latest_session_file()
         if latest:
@@ -21,12 +34,26 @@ class Persistence:
         else:
             self.start_new_session()
 
+    def _list_session_files(self) -> List[str]:
+        """Returns the sorted session filenames, re-listing the directory only when it changed."""
+        mtime = os.stat(self.sessions_dir).st_mtime_ns
+        if mtime != self._session_files_mtime:
+            files = sorted(f for f in os.listdir(self.sessions_dir) if f.endswith(".jsonl"))
+            self._session_files = files
+            self._filename_index = {f: i for i, f in enumerate(files)}
+            self._session_files_mtime = mtime
+        return self._session_files
+
+    def index_for_filename(self, filename: str) -> Optional[int]:
+        """Returns the session index for a session filename, or None if it does not exist."""
+        self._list_session_files()
+        return self._filename_index.get(filename)
+
     def _get_latest_session_file(self) -> Optional[str]:
         """Finds the most recent session file in the sessions directory."""
-        files = [f for f in os.listdir(self.sessions_dir) if f.endswith(".jsonl")]
+        files = self._list_session_files()
         if not files:
             return None
-        files.sort()
         return os.path.join(self.sessions_dir, files[-1])
 
     def start_new_session(self, title: Optional[str] = None):
@@ -39,13 +66,15 @@ class Persistence:
         # Ensure the file is created immediately
         with open(self.session_file, "w", encoding="utf-8") as f:
             pass
+        self._session_files_mtime = None
+        self._set_has_title_cache(False)
         if title:
             self.set_session_title(title)
 
     def _make_serializable(self, obj: Any) -> Any:
         """Recursively converts bytes to base64 strings."""
         if isinstance(obj, bytes):
-            return {"__bytes_b64__": base64.b64encode(obj).decode("utf-8")}
+            return {"__bytes_b64__": b2a_base64(obj, newline=False).decode("ascii")}
         if isinstance(obj, dict):
             return {k: self._make_serializable(v) for k, v in obj.items()}
         if isinstance(obj, list):
@@ -54,8 +83,9 @@ class Persistence:
 
     def save_message(self, role: str, content: str, name: Optional[str] = None, 
                      tool_call: Optional[Dict] = None, tool_result: Optional[Dict] = None,
-                     parts: Optional[List[Dict[str, Any]]] = None):
-        """Appends a message to the current session file with optional structural metadata and parts."""
+                     parts: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Appends a message to the current session file with optional structural metadata and parts.
+        Returns the message as load_history would return it."""
         data: Dict[str, Any] = {"role": role, "content": content, "timestamp": datetime.now().isoformat()}
         if name:
             data["name"] = name
@@ -67,8 +97,13 @@ class Persistence:
             data["parts"] = parts
             
         serializable_data = self._make_serializable(data)
-        with open(self.session_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(serializable_data) + "\n")
+        self._append_line(json.dumps(serializable_data) + "\n")
+
+        # A copy, so later changes to the caller's dicts (e.g. tool args) don't leak in
+        msg = self._to_history_message(self._restore_serialized(serializable_data))
+        if self._history_cache is not None and self._history_cache_file == self.session_file:
+            self._history_cache.append(msg)
+        return msg
 
     def set_session_title(self, title: str):
         """Sets the title for the current session by appending a metadata record."""
@@ -78,13 +113,46 @@ class Persistence:
             "value": title,
             "timestamp": datetime.now().isoformat()
         }
-        with open(self.session_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(data) + "\n")
+        self._append_line(json.dumps(data) + "\n")
+        self._set_has_title_cache(True)
+
+    def _set_has_title_cache(self, value: Optional[bool]):
+        self._has_title_cache = value
+        self._has_title_file = self.session_file
+
+    def begin_batch(self):
+        """Keeps session files open until commit_batch, so a turn opens each file once and
+        syncs it once. Records are still appended as they are made."""
+        if self._batch_files is None:
+            self._batch_files = {}
+
+    def commit_batch(self):
+        """Syncs the files written during the batch to disk, closes them and ends the batch."""
+        files, self._batch_files = self._batch_files, None
+        for f in (files or {}).values():
+            try:
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+
+    def _append_line(self, line: str):
+        if self._batch_files is None:
+            with open(self.session_file, "a", encoding="utf-8") as f:
+                f.write(line)
+            return
+        f = self._batch_files.get(self.session_file)
+        if f is None:
+            f = open(self.session_file, "a", encoding="utf-8")
+            self._batch_files[self.session_file] = f
+        f.write(line)
+        # Handed to the OS right away: if the process dies mid-turn, every record
+        # saved so far (e.g. results of tools that already ran) is kept
+        f.flush()
 
     def list_sessions(self) -> List[Dict[str, Any]]:
         """Lists all sessions with their indices, creation times, and titles."""
-        files = [f for f in os.listdir(self.sessions_dir) if f.endswith(".jsonl")]
-        files.sort()
+        files = self._list_session_files()
         
         sessions = []
         for i, filename in enumerate(files):
@@ -115,8 +183,7 @@ class Persistence:
 
     def switch_session(self, index: int) -> bool:
         """Switches to a session by its index."""
-        files = [f for f in os.listdir(self.sessions_dir) if f.endswith(".jsonl")]
-        files.sort()
+        files = self._list_session_files()
         
         if 0 <= index < len(files):
             self.session_file = os.path.join(self.sessions_dir, files[index])
@@ -125,16 +192,22 @@ class Persistence:
 
     def has_title(self) -> bool:
         """Checks if the current session has a title metadata record."""
+        if self._has_title_cache is not None and self._has_title_file == self.session_file:
+            return self._has_title_cache
+
+        found = False
         if os.path.exists(self.session_file):
             with open(self.session_file, "r", encoding="utf-8") as f:
                 for line in f:
                     try:
                         data = json.loads(line)
                         if data.get("type") == "metadata" and data.get("key") == "title":
-                            return True
+                            found = True
+                            break
                     except json.JSONDecodeError:
                         continue
-        return False
+        self._set_has_title_cache(found)
+        return found
 
     def _restore_serialized(self, obj: Any) -> Any:
         """Recursively restores base64 strings back to bytes."""
@@ -146,8 +219,29 @@ class Persistence:
             return [self._restore_serialized(v) for v in obj]
         return obj
 
+    def _to_history_message(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds the message dict returned by load_history from a stored record."""
+        msg: Dict[str, Any] = {"role": data["role"], "content": data["content"]}
+        if "name" in data:
+            msg["name"] = data["name"]
+        if "tool_call" in data:
+            msg["tool_call"] = data["tool_call"]
+        if "tool_result" in data:
+            msg["tool_result"] = data["tool_result"]
+        if "parts" in data:
+            msg["parts"] = data["parts"]
+        return msg
+
+    def invalidate_history_cache(self):
+        """Drops the in-memory history; call after rewriting the session file directly."""
+        self._history_cache = None
+        self._history_cache_file = None
+
     def load_history(self) -> List[Dict[str, Any]]:
         """Loads message history from the current session file, including metadata and parts."""
+        if self._history_cache is not None and self._history_cache_file == self.session_file:
+            return list(self._history_cache)
+
         history = []
         if os.path.exists(self.session_file):
             with open(self.session_file, "r", encoding="utf-8") as f:
@@ -157,21 +251,16 @@ class Persistence:
                     # Skip metadata records and other non-message types
                     if data.get("type") == "metadata" or "role" not in data:
                         continue
-                        
-                    msg: Dict[str, Any] = {"role": data["role"], "content": data["content"]}
-                    if "name" in data:
-                        msg["name"] = data["name"]
-                    if "tool_call" in data:
-                        msg["tool_call"] = data["tool_call"]
-                    if "tool_result" in data:
-                        msg["tool_result"] = data["tool_result"]
-                    if "parts" in data:
-                        msg["parts"] = data["parts"]
-                    history.append(msg)
-        return history
+                    history.append(self._to_history_message(data))
+
+        self._history_cache = history
+        self._history_cache_file = self.session_file
+        return list(history)
 
     def replace_history(self, messages: List[Dict[str, Any]]):
         """Overwrites the current session file with a new set of messages."""
+        self._set_has_title_cache(None)
+        self.invalidate_history_cache()
         with open(self.session_file, "w", encoding="utf-8") as f:
             for msg in messages:
                 msg["timestamp"] = datetime.now().isoformat()
@@ -181,8 +270,11 @@ class Persistence:
     def save_scheduled_tasks(self, tasks: List[Dict[str, str]]):
         """Saves the scheduled tasks list to a JSON file."""
         tasks_file = os.path.join(self.memory_dir, "scheduled_tasks.json")
-        with open(tasks_file, "w", encoding="utf-8") as f:
+        # Write a temp file and swap it in so a crash never leaves a half-written list
+        tmp_file = tasks_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(tasks, f, indent=2)
+        os.replace(tmp_file, tasks_file)
 
     def load_scheduled_tasks(self) -> List[Dict[str, str]]:
         """Loads the scheduled tasks list from a JSON file."""
@@ -2,6 +2,9 @@ import unittest
 from unittest.mock import MagicMock, patch
 import sys
 import os
+import socket
+import tempfile
+import threading
 
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -12,9 +15,10 @@ with patch("dotenv.load_dotenv"), patch("utils.config.load_config"):
 
 class TestDockerCheck(unittest.TestCase):
 
+    @patch("main._ping_docker_socket", return_value=False)
     @patch("docker.from_env")
     @patch("agent_system.utils.logger.info")
-    def test_docker_check_success(self, mock_logger, mock_docker):
+    def test_docker_check_success(self, mock_logger, mock_docker, mock_socket_ping):
         # Setup mock client
         mock_client = MagicMock()
         mock_docker.return_value = mock_client
@@ -25,10 +29,21 @@ class TestDockerCheck(unittest.TestCase):
         mock_client.ping.assert_called_once()
         mock_logger.assert_called_with("Docker daemon is running.")
 
+    @patch("main._ping_docker_socket", return_value=True)
+    @patch("docker.from_env")
+    @patch("agent_system.utils.logger.info")
+    def test_docker_check_socket_ping(self, mock_logger, mock_docker, mock_socket_ping):
+        main.check_docker()
+
+        # A successful socket ping skips the Docker SDK entirely
+        mock_docker.assert_not_called()
+        mock_logger.assert_called_with("Docker daemon is running.")
+
+    @patch("main._ping_docker_socket", return_value=False)
     @patch("docker.from_env")
     @patch("agent_system.utils.logger.error")
     @patch("sys.exit")
-    def test_docker_check_failure(self, mock_exit, mock_logger, mock_docker):
+    def test_docker_check_failure(self, mock_exit, mock_logger, mock_docker, mock_socket_ping):
         # Setup mock to raise error
         mock_docker.side_effect = Exception("Docker not running")
         
@@ -38,5 +53,29 @@ class TestDockerCheck(unittest.TestCase):
         # Check that error was logged
         self.assertTrue(any("Docker daemon is not running" in str(call) for call in mock_logger.call_args_list))
 
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "needs Unix sockets")
+    def test_socket_ping_non_docker_reply(self):
+        # Something other than Docker answering on the socket must not crash startup
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "docker.sock")
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(path)
+            server.listen(1)
+
+            def reply_garbage():
+                conn, _ = server.accept()
+                conn.recv(1024)
+                conn.sendall(b"garbage\r\n\r\n")
+                conn.close()
+
+            thread = threading.Thread(target=reply_garbage)
+            thread.start()
+            try:
+                with patch.dict(os.environ, {"DOCKER_HOST": f"unix://{path}"}):
+                    self.assertFalse(main._ping_docker_socket())
+            finally:
+                thread.join(timeout=5)
+                server.close()
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
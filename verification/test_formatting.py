@@ -63,6 +63,17 @@ class TestFormatting(unittest.TestCase):
         expected = "• Item 1\n• Item 2"
         self.assertEqual(self.telegram._format_markdown(text), expected)
 
+    def test_telegram_split_balances_tags(self):
+        text = "<b>" + ("word " * 300) + "</b>" + ('<a href="https://x.y">' + "z" * 900 + "</a>")
+        chunks = self.telegram._split_message(text, 1000)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 1000)
+            self.assertEqual(chunk.count("<b>"), chunk.count("</b>"))
+            self.assertEqual(chunk.count("<a "), chunk.count("</a>"))
+        # Continuation chunks re-open the link with its href
+        self.assertTrue(chunks[-1].startswith('<a href="https://x.y">'))
+
     def test_terminal_bold(self):
         text = "This is **bold** text."
         # \033[1m is bold, \033[0m is reset
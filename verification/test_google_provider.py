@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime, timedelta, timezone
+import os
+import sys
+import tempfile
+
+# Add the project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from agent_system.providers import google_provider
+from agent_system.providers.google_provider import GoogleProvider
+
+
+class TestGoogleFileCache(unittest.TestCase):
+
+    def setUp(self):
+        google_provider._file_cache.clear()
+        google_provider._file_cache_bytes = 0
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        google_provider._file_cache.clear()
+        google_provider._file_cache_bytes = 0
+        self.tmp.cleanup()
+
+    def _read(self, name, size):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        st = os.stat(path)
+        return google_provider._read_file_cached(path, st.st_mtime_ns, st.st_size)
+
+    def test_cache_bounded_by_total_bytes(self):
+        with patch.object(google_provider, "_FILE_CACHE_MAX_BYTES", 250):
+            for name in ("a", "b", "c"):
+                self.assertEqual(len(self._read(name, 100)), 100)
+            # The oldest file is evicted to stay within the byte budget
+            self.assertEqual(len(google_provider._file_cache), 2)
+            self.assertEqual(google_provider._file_cache_bytes, 200)
+
+            # Files larger than the whole budget are read but not cached
+            self.assertEqual(len(self._read("big", 300)), 300)
+            self.assertEqual(google_provider._file_cache_bytes, 200)
+
+def _file(name, state="ACTIVE", expires_in=3600):
+    f = MagicMock(uri=f"https://files/{name}", state=state)
+    f.name = name
+    f.expiration_time = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+    return f
+
+
+class TestGoogleFileUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = GoogleProvider(api_key="")
+        self.provider.client = MagicMock()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "video.mp4")
+        with open(self.path, "wb") as f:
+            f.write(b"frames")
+        self.st = os.stat(self.path)
+        sleep_patch = patch.object(google_provider.time, "sleep")
+        self.mock_sleep = sleep_patch.start()
+        self.addCleanup(sleep_patch.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _upload(self):
+        return self.provider._upload_file(self.path, self.st, "video/mp4")
+
+    def test_upload_is_reused(self):
+        uploaded = _file("files/a")
+        self.provider.client.files.upload.return_value = uploaded
+        self.assertIs(self._upload(), uploaded)
+        self.assertIs(self._upload(), uploaded)
+        self.provider.client.files.upload.assert_called_once()
+        self.provider.client.files.get.assert_not_called()
+
+    def test_expired_upload_is_replaced(self):
+        expired, fresh = _file("files/old", expires_in=-1), _file("files/new")
+        self.provider.client.files.upload.side_effect = [expired, fresh]
+        self.assertIs(self._upload(), expired)
+        self.assertIs(self._upload(), fresh)
+        self.assertEqual(self.provider.client.files.upload.call_count, 2)
+
+    def test_waits_until_active(self):
+        self.provider.client.files.upload.return_value = _file("files/a", "PROCESSING")
+        active = _file("files/a")
+        self.provider.client.files.get.side_effect = [_file("files/a", "PROCESSING"), active]
+        self.assertIs(self._upload(), active)
+        self.assertEqual(self.provider.client.files.get.call_count, 2)
+        self.provider.client.files.get.assert_called_with(name="files/a")
+
+    def test_failed_upload_is_not_cached(self):
+        self.provider.client.files.upload.return_value = _file("files/a", "PROCESSING")
+        self.provider.client.files.get.return_value = _file("files/a", "FAILED")
+        self.assertIsNone(self._upload())
+        self.assertEqual(len(self.provider._uploaded_files), 0)
+
+        # Too large to inline, so the model is told the file could not be sent
+        with patch.object(google_provider, "_INLINE_LIMIT_BYTES", 0):
+            converted = self.provider._convert_message(
+                {"role": "user", "parts": [{"file_path": self.path, "mime_type": "video/mp4"}]})
+        self.assertEqual(converted["parts"], [{"text": "[File Upload Failed: video.mp4]"}])
+
+    def test_processing_timeout(self):
+        self.provider.client.files.upload.return_value = _file("files/a", "PROCESSING")
+        self.provider.client.files.get.return_value = _file("files/a", "PROCESSING")
+        with patch.object(google_provider, "_UPLOAD_READY_TIMEOUT", 0):
+            self.assertIsNone(self._upload())
+
+    def test_uploads_bounded(self):
+        self.provider.client.files.upload.side_effect = lambda file, config: _file(file)
+        with patch.object(google_provider, "_UPLOADED_FILES_MAX", 2):
+            for i in range(3):
+                self.provider._upload_file(f"{self.path}.{i}", self.st, "video/mp4")
+        self.assertEqual([k[0] for k in self.provider._uploaded_files],
+                         [f"{self.path}.1", f"{self.path}.2"])
+
+if __name__ == "__main__":
+    unittest.main()
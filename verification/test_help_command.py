@@ -46,6 +46,7 @@ def test_command_registry():
         "handler": lambda: True,
         "description": "A test command"
     }
+    engine._build_help_text()
     engine._handle_help()
     args, kwargs = channel.send_output.call_args
     help_text = args[0]
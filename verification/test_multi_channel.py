@@ -3,6 +3,7 @@ from unittest.mock import MagicMock, patch
 import os
 import sys
 import queue
+import shutil
 import time
 
 # Add the project root to sys.path
@@ -75,5 +76,52 @@ class TestMultiChannel(unittest.TestCase):
         # channel1 should still have its messages: Init + Activity + Response
         self.assertEqual(len(self.channel1.outputs), 3) 
 
+    def test_burst_inputs_coalesced(self):
+        from agent_system.core.scheduler import ScheduledTask
+        task_a = ScheduledTask("Water plants", "s.jsonl", "at", "2030-01-01T00:00:00")
+        task_b = ScheduledTask("Check mail", "s.jsonl", "at", "2030-01-01T00:00:00")
+        for item in [(self.channel1, "one"), (self.channel1, "two"), (self.channel1, "/help"),
+                     (self.channel2, task_a), (self.channel2, task_b)]:
+            self.engine._put_input(*item)
+
+        self.assertEqual(self.engine._next_input(), (self.channel1, "one\ntwo"))
+        self.assertEqual(self.engine._next_input(), (self.channel1, "/help"))
+        channel, task = self.engine._next_input()
+        self.assertIs(channel, self.channel2)
+        self.assertEqual(task.prompt, "Scheduled Tasks:\n- Water plants\n- Check mail")
+        self.assertEqual(task_a.prompt, "Water plants")
+
+    def test_output_files_sent_in_order_one_at_a_time(self):
+        import tempfile
+        import threading
+        workspace = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workspace)
+        self.engine.workspace_dir = workspace
+        os.makedirs(os.path.join(workspace, "output"))
+        for i in range(4):
+            with open(os.path.join(workspace, "output", f"file_{i}.txt"), "w") as f:
+                f.write(str(i))
+
+        sent = []
+        active = []
+        lock = threading.Lock()
+        def send_file(file_path, caption=None):
+            with lock:
+                active.append(file_path)
+                overlapping = len(active)
+            time.sleep(0.02)
+            with lock:
+                active.remove(file_path)
+            sent.append((os.path.basename(file_path), overlapping))
+        self.channel1.send_file = send_file
+        self.engine.current_channel = self.channel1
+
+        with os.scandir(os.path.join(workspace, "output")) as it:
+            expected = [entry.name for entry in it]
+        self.engine._scan_and_send_output_files()
+
+        self.assertEqual([name for name, _ in sent], expected)
+        self.assertTrue(all(overlapping == 1 for _, overlapping in sent))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,179 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import base64
+import binascii
+import functools
+import json
+import os
+import sys
+import tempfile
+
+# Add the project root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from agent_system.providers import nano_gpt_provider
+from agent_system.providers.nano_gpt_provider import NanoGPTProvider
+
+
+def _call(name, call_id=None):
+    tool_call = {"name": name, "args": {}}
+    if call_id:
+        tool_call["id"] = call_id
+    return {"role": "model", "content": "", "tool_call": tool_call}
+
+
+def _result(name=None):
+    msg = {"role": "tool", "content": "", "tool_result": {"ok": True}}
+    if name:
+        msg["name"] = name
+    return msg
+
+
+class TestNanoGPTBuildMessages(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = NanoGPTProvider(api_key="test_key")
+
+    def _result_ids(self, messages):
+        built = self.provider._build_messages(messages)
+        return [m["tool_call_id"] for m in built if m["role"] == "tool"]
+
+    def test_repeated_call_ids(self):
+        # Some backends reuse the same id every turn
+        messages = [
+            _call("echo", "call_0"), _result("echo"),
+            _call("echo", "call_0"), _result("echo"),
+        ]
+        self.assertEqual(self._result_ids(messages), ["call_0", "call_0"])
+
+    def test_nameless_results_answer_oldest_call(self):
+        messages = [
+            _call("a", "id_a"), _call("b", "id_b"),
+            _result("b"), _result(),
+        ]
+        self.assertEqual(self._result_ids(messages), ["id_b", "id_a"])
+
+    def test_nameless_result_does_not_reanswer_call(self):
+        messages = [
+            _call("a", "id_a"), _call("a", "id_a2"),
+            _result(), _result("a"),
+        ]
+        self.assertEqual(self._result_ids(messages), ["id_a", "id_a2"])
+
+    def test_unmatched_result_gets_new_id(self):
+        messages = [_call("a", "id_a"), _result("a"), _result("a")]
+        self.assertEqual(self._result_ids(messages), ["id_a", "call_2"])
+
+class TestNanoGPTGenerateResponse(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = NanoGPTProvider(api_key="test_key")
+        response = MagicMock(status_code=200)
+        response.content = b'{"choices": [{"message": {"content": "Title"}}], "usage": {"total_tokens": 7}}'
+        self.provider.session.post = MagicMock(return_value=response)
+
+    def test_background_call_keeps_usage(self):
+        before = self.provider.get_usage()
+        result = self.provider.generate_response([{"role": "user", "content": "hi"}], background=True)
+        self.assertEqual(result, "Title")
+        self.assertIs(self.provider.get_usage(), before)
+
+        self.provider.generate_response([{"role": "user", "content": "hi"}])
+        self.assertEqual(self.provider.get_usage()["total_tokens"], 7)
+
+class TestNanoGPTDataUrls(unittest.TestCase):
+
+    def setUp(self):
+        nano_gpt_provider._encode_data_url.cache_clear()
+        nano_gpt_provider._data_urls_by_digest.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        nano_gpt_provider._encode_data_url.cache_clear()
+        nano_gpt_provider._data_urls_by_digest.clear()
+        self.tmp.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def _check_sizes(self):
+        chunk = nano_gpt_provider._ENCODE_CHUNK_BYTES
+        mmap_min = nano_gpt_provider._MMAP_MIN_BYTES
+        sizes = [0, 1, chunk - 1, chunk, chunk + 1, 2 * chunk + 2, mmap_min - 1, mmap_min, mmap_min + 1]
+        for size in sizes:
+            data = os.urandom(size)
+            path = self._write(f"img_{size}.png", data)
+            expected = "data:image/png;base64," + base64.b64encode(data).decode("ascii")
+            self.assertEqual(nano_gpt_provider._image_data_url(path, "image/png"), expected, size)
+
+    def test_matches_b64encode_at_boundaries(self):
+        self._check_sizes()
+
+    def test_matches_b64encode_with_binascii_encoder(self):
+        # The encoder used when pybase64 is not installed
+        encoder = functools.partial(binascii.b2a_base64, newline=False)
+        with patch.object(nano_gpt_provider, "_b64encode", encoder):
+            self._check_sizes()
+
+    def test_changed_file_is_reencoded(self):
+        path = self._write("img.png", b"first")
+        first = nano_gpt_provider._image_data_url(path, "image/png")
+        self.assertIs(nano_gpt_provider._image_data_url(path, "image/png"), first)
+
+        # Same size, new content and mtime
+        self._write("img.png", b"secnd")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        second = nano_gpt_provider._image_data_url(path, "image/png")
+        self.assertEqual(second, "data:image/png;base64," + base64.b64encode(b"secnd").decode("ascii"))
+
+    def test_read_error_is_not_cached(self):
+        path = self._write("img.png", b"pixels")
+        with patch("builtins.open", side_effect=PermissionError("denied")):
+            self.assertIsNone(nano_gpt_provider._image_data_url(path, "image/png"))
+        # The same (path, mtime, size) is read again once the error clears
+        self.assertEqual(nano_gpt_provider._image_data_url(path, "image/png"),
+                         "data:image/png;base64," + base64.b64encode(b"pixels").decode("ascii"))
+
+    def test_identical_images_share_one_string(self):
+        a = self._write("a.png", b"same bytes")
+        b = self._write("b.png", b"same bytes")
+        self.assertIs(nano_gpt_provider._image_data_url(a, "image/png"),
+                      nano_gpt_provider._image_data_url(b, "image/png"))
+
+class TestNanoGPTRequestBody(unittest.TestCase):
+
+    def _post(self, messages, tools=None):
+        provider = NanoGPTProvider(api_key="test_key", model_name="test-model")
+        response = MagicMock(status_code=200)
+        body = {"choices": [{"message": {"content": "ok"}}]}
+        response.content = json.dumps(body).encode()
+        response.json.return_value = body
+        provider.session.post = MagicMock(return_value=response)
+        self.assertEqual(provider.generate_response(messages, tools=tools), "ok")
+        sent = json.loads(provider.session.post.call_args.kwargs["data"])
+        expected = {"model": "test-model", "messages": provider._build_messages(messages)}
+        if tools:
+            expected["tools"] = [provider._normalize_tool_schema(t) for t in tools]
+            expected["tool_choice"] = "auto"
+        return sent, expected
+
+    def _check_bodies(self):
+        messages = [{"role": "system", "content": "Be brief"}, {"role": "user", "content": "Grüße \u2603 \"quoted\""}]
+        tools = [{"name": "echo", "description": "Echo", "parameters": {"type": "OBJECT", "properties": {"text": {"type": "STRING"}}}}]
+        for call_tools in (None, tools):
+            sent, expected = self._post(messages, call_tools)
+            self.assertEqual(sent, expected)
+
+    def test_spliced_body_matches_payload(self):
+        self._check_bodies()
+
+    def test_spliced_body_matches_payload_without_orjson(self):
+        with patch.object(nano_gpt_provider, "orjson", None):
+            self._check_bodies()
+
+if __name__ == "__main__":
+    unittest.main()
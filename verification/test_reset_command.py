@@ -10,14 +10,21 @@ if project_root not in sys.path:
 
 from agent_system.core.engine import Engine
 
-@patch("os.listdir")
-@patch("os.path.isfile")
-@patch("os.path.isdir")
+def make_entry(path, is_file, is_dir):
+    entry = MagicMock()
+    entry.name = os.path.basename(path)
+    entry.path = path
+    entry.is_file.return_value = is_file
+    entry.is_dir.return_value = is_dir
+    entry.is_symlink.return_value = False
+    return entry
+
+@patch("os.scandir")
 @patch("os.unlink")
 @patch("shutil.rmtree")
 @patch("os.path.exists")
 @patch("os.makedirs")
-def test_reset_command(mock_makedirs, mock_exists, mock_rmtree, mock_unlink, mock_isdir, mock_isfile, mock_listdir):
+def test_reset_command(mock_makedirs, mock_exists, mock_rmtree, mock_unlink, mock_scandir):
     provider = MagicMock()
     channel = MagicMock()
     persistence = MagicMock()
@@ -30,15 +37,11 @@ def test_reset_command(mock_makedirs, mock_exists, mock_rmtree, mock_unlink, moc
         return True
     mock_exists.side_effect = exists_side_effect
     
-    mock_listdir.return_value = ["file1.txt", "dir1"]
-    
-    def is_file_side_effect(path):
-        return "file1.txt" in path
-    def is_dir_side_effect(path):
-        return "dir1" in path
-        
-    mock_isfile.side_effect = is_file_side_effect
-    mock_isdir.side_effect = is_dir_side_effect
+    abs_workspace = os.path.abspath("test_workspace")
+    mock_scandir.return_value.__enter__.return_value = [
+        make_entry(os.path.join(abs_workspace, "file1.txt"), is_file=True, is_dir=False),
+        make_entry(os.path.join(abs_workspace, "dir1"), is_file=False, is_dir=True),
+    ]
     
     # Mock Engine initialization methods
     with patch.object(Engine, "_load_system_prompt", return_value="System Prompt"):
@@ -54,8 +57,6 @@ def test_reset_command(mock_makedirs, mock_exists, mock_rmtree, mock_unlink, moc
             persistence.start_new_session.assert_called_once()
             print("✓ persistence.start_new_session called.")
             
-            abs_workspace = os.path.abspath("test_workspace")
-            
             # Verify os.unlink was called for the file
             mock_unlink.assert_called_with(os.path.join(abs_workspace, "file1.txt"))
             print("✓ os.unlink called for file1.txt.")
@@ -5,6 +5,8 @@ import shutil
 import json
 from datetime import datetime, timedelta
 from agent_system.core.scheduler import Scheduler, ScheduledTask
+from unittest.mock import patch
+from utils.config import env_number
 from utils.persistence import Persistence
 
 class TestSchedulerIntegration(unittest.TestCase):
@@ -47,6 +49,46 @@ class TestSchedulerIntegration(unittest.TestCase):
         # Check if task is removed from scheduler
         self.assertEqual(len(self.scheduler.tasks), 0)
 
+    def test_new_earlier_task_wakes_loop(self):
+        self.scheduler = Scheduler(self.persistence, self.on_task_trigger)
+        later = (datetime.now().astimezone() + timedelta(hours=1)).isoformat()
+        self.scheduler.add_task("Later", "session_1.jsonl", "at", later)
+        self.scheduler.start()
+        time.sleep(0.2)
+
+        # The loop is waiting for the task an hour away; an earlier one must still fire on time
+        soon = (datetime.now().astimezone() + timedelta(seconds=0.5)).isoformat()
+        task = self.scheduler.add_task("Soon", "session_1.jsonl", "at", soon)
+        time.sleep(1.5)
+
+        self.assertEqual([t.id for t in self.triggered_tasks], [task.id])
+        self.assertEqual(len(self.scheduler.tasks), 1)
+
+    def test_cron_task_advances_tick_by_tick(self):
+        task = ScheduledTask("Cron", "session_1.jsonl", "cron", "*/5 * * * *")
+        first = datetime.fromisoformat(task.next_run)
+        second = datetime.fromisoformat(task.next_cron_run())
+        self.assertEqual(second - first, timedelta(minutes=5))
+        self.assertGreater(first, datetime.now().astimezone())
+
+    def test_naive_next_run_stored_as_local_time(self):
+        naive = datetime.now().replace(microsecond=0) + timedelta(hours=1)
+        task = ScheduledTask("Naive", "session_1.jsonl", "at", naive.isoformat())
+        self.assertIsNotNone(datetime.fromisoformat(task.next_run).tzinfo)
+        self.assertEqual(task.next_run_ts, naive.timestamp())
+
+    def test_parsed_next_run_passed_through(self):
+        self.scheduler = Scheduler(self.persistence, self.on_task_trigger)
+        run_at = datetime.now().astimezone().replace(microsecond=0) + timedelta(hours=1)
+        task = self.scheduler.add_task("Parsed", "session_1.jsonl", "at", run_at.isoformat(), next_run=run_at)
+        self.assertEqual(task.next_run, run_at.isoformat())
+        self.assertEqual(task.next_run_ts, run_at.timestamp())
+
+    def test_max_sleep_setting_parsed_defensively(self):
+        for raw, expected in [("", 60.0), ("soon", 60.0), ("nan", 60.0), ("-5", 1.0), ("30", 30.0)]:
+            with patch.dict(os.environ, {"SCHEDULER_MAX_SLEEP": raw}):
+                self.assertEqual(env_number("SCHEDULER_MAX_SLEEP", 60.0, minimum=1.0), expected)
+
     def test_persistence_of_tasks(self):
         self.scheduler = Scheduler(self.persistence, self.on_task_trigger)
         
@@ -61,6 +103,32 @@ class TestSchedulerIntegration(unittest.TestCase):
         self.assertEqual(self.scheduler.tasks[0].id, task.id)
         self.assertEqual(self.scheduler.tasks[0].trigger_type, "at")
 
+    def test_executions_flushed_on_stop(self):
+        self.scheduler = Scheduler(self.persistence, self.on_task_trigger)
+        past = (datetime.now().astimezone() - timedelta(seconds=1)).isoformat()
+        self.scheduler.add_task("Due", "session_1.jsonl", "at", past)
+
+        self.scheduler._drain_added()
+        self.scheduler._check_and_run_tasks()
+        # The removal is batched rather than written per execution
+        self.assertEqual(len(self.persistence.load_scheduled_tasks()), 1)
+
+        self.scheduler.stop()
+        self.assertEqual(self.persistence.load_scheduled_tasks(), [])
+
+    def test_due_callbacks_run_in_due_order(self):
+        self.scheduler = Scheduler(self.persistence, self.on_task_trigger)
+        now = datetime.now().astimezone()
+        tasks = [
+            self.scheduler.add_task(f"Due {i}", "session_1.jsonl", "at", (now - timedelta(seconds=10 - i)).isoformat())
+            for i in range(8)
+        ]
+
+        self.scheduler._drain_added()
+        self.scheduler._check_and_run_tasks()
+        self.scheduler._callback_pool.shutdown(wait=True)
+        self.assertEqual([t.id for t in self.triggered_tasks], [t.id for t in tasks])
+
     def test_list_and_remove_task(self):
         self.scheduler = Scheduler(self.persistence, self.on_task_trigger)
         
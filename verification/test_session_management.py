@@ -3,6 +3,7 @@ import sys
 import unittest
 import shutil
 import tempfile
+import threading
 import json
 from datetime import datetime
 
@@ -72,6 +73,15 @@ class TestSessionManagement(unittest.TestCase):
         self.assertEqual(len(history), 1)
         self.assertEqual(history[0]["content"], "Hello first")
 
+    def test_index_for_filename(self):
+        first = os.path.basename(self.persistence.session_file)
+        self.persistence.start_new_session()
+        second = os.path.basename(self.persistence.session_file)
+
+        self.assertEqual(self.persistence.index_for_filename(first), 0)
+        self.assertEqual(self.persistence.index_for_filename(second), 1)
+        self.assertIsNone(self.persistence.index_for_filename("missing.jsonl"))
+
     def test_load_history_filters_metadata(self):
         self.persistence.save_message("user", "Regular message")
         self.persistence.set_session_title("Some Title")
@@ -82,6 +92,44 @@ class TestSessionManagement(unittest.TestCase):
         self.assertEqual(history[0]["role"], "user")
         self.assertEqual(history[1]["role"], "assistant")
 
+    def test_history_cache_matches_file(self):
+        self.persistence.save_message("user", "Before cache")
+        self.persistence.load_history()
+
+        tool_call = {"name": "echo", "args": {"text": "hi"}}
+        self.persistence.save_message("model", "", tool_call=tool_call)
+        # Mutating the caller's dict after saving must not change the cached history
+        tool_call["args"]["_workspace"] = "/tmp"
+
+        cached = self.persistence.load_history()
+        self.persistence.invalidate_history_cache()
+        self.assertEqual(cached, self.persistence.load_history())
+        self.assertNotIn("_workspace", cached[1]["tool_call"]["args"])
+
+        # Switching sessions must not serve the previous session's messages
+        self.persistence.start_new_session()
+        self.assertEqual(self.persistence.load_history(), [])
+
+    def test_batched_writes(self):
+        self.persistence.begin_batch()
+        self.persistence.save_message("user", "Saved")
+        # Records reach the file as they are made, before the batch is committed
+        with open(self.persistence.session_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual(len(self.persistence.load_history()), 1)
+
+        self.persistence.save_message("assistant", "Reply")
+        with patch("utils.persistence.os.fsync") as mock_fsync:
+            self.persistence.commit_batch()
+        mock_fsync.assert_called_once()
+        with open(self.persistence.session_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+        # Outside a batch, writes go straight to the file again
+        self.persistence.save_message("user", "After")
+        with open(self.persistence.session_file, "r", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+
     def test_has_title(self):
         self.assertFalse(self.persistence.has_title())
         self.persistence.set_session_title("Title")
@@ -97,7 +145,8 @@ class TestEngineAutoTitling(unittest.TestCase):
         channel = MagicMock()
         persistence = MagicMock()
         
-        # Setup mocks
+        # Setup mocks; the channel's own polling thread never delivers input
+        channel.get_input.side_effect = lambda: threading.Event().wait()
         persistence.has_title.return_value = False
         provider.generate_response.return_value = "Auto Title"
         
@@ -107,10 +156,15 @@ class TestEngineAutoTitling(unittest.TestCase):
                 engine = Engine(provider=provider, channels=[channel], persistence=persistence)
                 engine.current_channel = channel
                 
-                # Simulate first user message
-                # Mock the input queue and stop activity to avoid infinite loop
-                engine.input_queue = MagicMock()
-                engine.input_queue.get.side_effect = [(channel, "First message"), KeyboardInterrupt]
+                # Simulate first user message, then let the background title request
+                # finish and hand its result to the loop, then stop
+                def inputs():
+                    yield (channel, "First message")
+                    engine._bg_pool.shutdown(wait=True)
+                    yield Engine._next_input(engine)
+                    raise KeyboardInterrupt
+                feed = inputs()
+                engine._next_input = lambda: next(feed)
                 
                 try:
                     engine.run()
@@ -120,6 +174,8 @@ class TestEngineAutoTitling(unittest.TestCase):
                 # Verify auto-titling was triggered
                 persistence.set_session_title.assert_called_with("Auto Title")
                 provider.generate_response.assert_called()
+                # The title request must not overwrite the main turn's usage or caches
+                self.assertTrue(provider.generate_response.call_args_list[0].kwargs.get("background"))
 
 if __name__ == "__main__":
     unittest.main()
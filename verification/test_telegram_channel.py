@@ -1,5 +1,6 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import json
 import os
 import sys
 import time
@@ -22,7 +23,7 @@ class TestTelegramChannel(unittest.TestCase):
     def test_get_input_text(self, mock_sleep):
         # Mocking session.get response
         mock_resp = MagicMock()
-        mock_resp.json.return_value = {
+        mock_resp.content = json.dumps({
             "ok": True,
             "result": [
                 {
@@ -33,7 +34,7 @@ class TestTelegramChannel(unittest.TestCase):
                     }
                 }
             ]
-        }
+        }).encode()
         self.channel.session.get = MagicMock(return_value=mock_resp)
         
         result = self.channel.get_input()
@@ -44,7 +45,7 @@ class TestTelegramChannel(unittest.TestCase):
     def test_get_input_restricted(self, mock_sleep):
         # Mocking session.get with a message from a different chat ID then a valid one
         mock_resp_unauthorized = MagicMock()
-        mock_resp_unauthorized.json.return_value = {
+        mock_resp_unauthorized.content = json.dumps({
             "ok": True,
             "result": [
                 {
@@ -55,10 +56,10 @@ class TestTelegramChannel(unittest.TestCase):
                     }
                 }
             ]
-        }
+        }).encode()
         
         mock_resp_authorized = MagicMock()
-        mock_resp_authorized.json.return_value = {
+        mock_resp_authorized.content = json.dumps({
             "ok": True,
             "result": [
                 {
@@ -69,16 +70,78 @@ class TestTelegramChannel(unittest.TestCase):
                     }
                 }
             ]
-        }
+        }).encode()
         
         self.channel.session.get = MagicMock(side_effect=[mock_resp_unauthorized, mock_resp_authorized])
         
         result = self.channel.get_input()
         self.assertEqual(result, "Authorized")
 
+    @patch("time.sleep", return_value=None)
+    def test_get_input_buffers_batch(self, mock_sleep):
+        mock_resp = MagicMock()
+        mock_resp.content = json.dumps({
+            "ok": True,
+            "result": [
+                {"update_id": 7, "message": {"chat": {"id": 12345}, "text": "first"}},
+                {"update_id": 8, "message": {"chat": {"id": 12345}, "text": "second"}}
+            ]
+        }).encode()
+        self.channel.session.get = MagicMock(return_value=mock_resp)
+
+        self.assertEqual(self.channel.get_input(), "first")
+        self.assertEqual(self.channel.offset, 9)
+        # The rest of the batch is served without another getUpdates call
+        self.assertEqual(self.channel.get_input(), "second")
+        self.channel.session.get.assert_called_once()
+
+    @patch("time.sleep", return_value=None)
+    def test_get_input_long_poll_timeouts(self, mock_sleep):
+        empty_resp = MagicMock()
+        empty_resp.content = json.dumps({"ok": True, "result": []}).encode()
+        text_resp = MagicMock()
+        text_resp.content = json.dumps({
+            "ok": True,
+            "result": [{"update_id": 5, "message": {"chat": {"id": 12345}, "text": "Hi"}}]
+        }).encode()
+        self.channel.session.get = MagicMock(side_effect=[empty_resp, text_resp])
+
+        self.assertEqual(self.channel.get_input(), "Hi")
+        # Empty polls must not add an idle sleep
+        mock_sleep.assert_not_called()
+        args, kwargs = self.channel.session.get.call_args
+        self.assertEqual(kwargs["params"]["timeout"], 30)
+        self.assertGreater(kwargs["timeout"][1], kwargs["params"]["timeout"])
+
+    def test_download_streams_to_file_object(self):
+        mock_resp = MagicMock()
+        mock_resp.__enter__.return_value = mock_resp
+        mock_resp.iter_content.return_value = [b"abc", b"def"]
+        self.channel.file_session.get = MagicMock(return_value=mock_resp)
+
+        buf = self.channel._download("https://example.com/file")
+        self.assertEqual(buf.read(), b"abcdef")
+        buf.close()
+        args, kwargs = self.channel.file_session.get.call_args
+        self.assertTrue(kwargs["stream"])
+
+    def test_document_download_url_prefetched(self):
+        file_resp = MagicMock()
+        file_resp.content = json.dumps({"ok": True, "result": {"file_path": "documents/file_1.pdf"}}).encode()
+        self.channel.session.get = MagicMock(return_value=file_resp)
+        self.channel._download = MagicMock(return_value=b"pdf")
+
+        attachment = self.channel._process_document({"file_id": "abc", "file_name": "a.pdf"})
+        self.assertIsInstance(attachment, FileAttachment)
+        self.assertEqual(attachment.content_getter(), b"pdf")
+        self.channel.session.get.assert_called_once()
+        self.channel._download.assert_called_once_with(
+            f"https://api.telegram.org/file/bot{self.token}/documents/file_1.pdf"
+        )
+
     def test_send_output(self):
         mock_resp = MagicMock()
-        mock_resp.json.return_value = {"ok": True}
+        mock_resp.content = json.dumps({"ok": True}).encode()
         self.channel.session.post = MagicMock(return_value=mock_resp)
         
         self.channel.send_output("Test Response")
@@ -87,6 +150,19 @@ class TestTelegramChannel(unittest.TestCase):
         self.assertEqual(kwargs["json"]["text"], "Test Response")
         self.assertEqual(kwargs["json"]["chat_id"], self.chat_id)
 
+    @patch("time.sleep", return_value=None)
+    def test_send_output_rate_limited(self, mock_sleep):
+        mock_resp = MagicMock()
+        mock_resp.content = json.dumps({"ok": True}).encode()
+        self.channel.session.post = MagicMock(return_value=mock_resp)
+
+        now = time.monotonic()
+        self.channel._bucket.extend([now] * self.channel._max_sends_per_second)
+        self.channel.send_output("Over the limit")
+
+        mock_sleep.assert_called_once()
+        self.channel.session.post.assert_called_once()
+
     def test_send_file(self):
         # Create a dummy file
         with open("dummy.txt", "w") as f:
@@ -94,7 +170,7 @@ class TestTelegramChannel(unittest.TestCase):
         
         try:
             mock_resp = MagicMock()
-            mock_resp.json.return_value = {"ok": True}
+            mock_resp.content = json.dumps({"ok": True}).encode()
             self.channel.session.post = MagicMock(return_value=mock_resp)
             
             self.channel.send_file("dummy.txt", caption="Here is a file")
@@ -106,9 +182,36 @@ class TestTelegramChannel(unittest.TestCase):
             if os.path.exists("dummy.txt"):
                 os.remove("dummy.txt")
 
+    def test_set_commands_skips_unchanged(self):
+        registered = MagicMock()
+        registered.content = json.dumps({"ok": True, "result": [{"command": "help", "description": "Show help"}]}).encode()
+        self.channel.session.get = MagicMock(return_value=registered)
+        mock_resp = MagicMock()
+        mock_resp.content = json.dumps({"ok": True}).encode()
+        self.channel.session.post = MagicMock(return_value=mock_resp)
+
+        # The bot already has this command list, e.g. from a previous run
+        self.channel.set_commands({"/help": {"description": "Show help"}})
+        self.channel.session.post.assert_not_called()
+        self.assertIn("getMyCommands", self.channel.session.get.call_args[0][0])
+
+        # A changed command list (or one edited elsewhere) is registered again
+        self.channel.set_commands({"/reset": {"description": "Reset"}})
+        self.channel.session.post.assert_called_once()
+        self.assertIn("setMyCommands", self.channel.session.post.call_args[0][0])
+
+    def test_set_commands_when_lookup_fails(self):
+        self.channel.session.get = MagicMock(side_effect=Exception("network down"))
+        mock_resp = MagicMock()
+        mock_resp.content = json.dumps({"ok": True}).encode()
+        self.channel.session.post = MagicMock(return_value=mock_resp)
+
+        self.channel.set_commands({"/help": {"description": "Show help"}})
+        self.channel.session.post.assert_called_once()
+
     def test_show_activity(self):
         mock_resp = MagicMock()
-        mock_resp.json.return_value = {"ok": True}
+        mock_resp.content = json.dumps({"ok": True}).encode()
         self.channel.session.post = MagicMock(return_value=mock_resp)
         
         self.channel.show_activity("typing")
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import time
+import json
 import os
 import sys
 
@@ -19,7 +20,7 @@ class TestTelegramPersistentIndicators(unittest.TestCase):
 
     def test_show_activity_periodic(self):
         mock_resp = MagicMock()
-        mock_resp.json.return_value = {"ok": True}
+        mock_resp.content = json.dumps({"ok": True}).encode()
         self.channel.session.post = MagicMock(return_value=mock_resp)
         
         # Start activity
@@ -41,7 +42,7 @@ class TestTelegramPersistentIndicators(unittest.TestCase):
 
     def test_stop_activity_on_send(self):
         mock_resp = MagicMock()
-        mock_resp.json.return_value = {"ok": True}
+        mock_resp.content = json.dumps({"ok": True}).encode()
         self.channel.session.post = MagicMock(return_value=mock_resp)
         
         # Start activity
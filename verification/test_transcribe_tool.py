@@ -6,11 +6,12 @@ import sys
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from tools.transcribe_audio import execute
+from tools.transcribe_audio import execute, _MODEL_CACHE
 
 class TestTranscribeAudio(unittest.TestCase):
 
     def setUp(self):
+        _MODEL_CACHE.clear()
         self.workspace = "test_transcribe_workspace"
         if not os.path.exists(self.workspace):
             os.makedirs(self.workspace)
@@ -78,6 +79,21 @@ class TestTranscribeAudio(unittest.TestCase):
         self.assertIn("Detected Language: es", result)
         mock_model_instance.transcribe.assert_called_once_with(self.audio_path, beam_size=5, language="es")
 
+    @patch("tools.transcribe_audio.WhisperModel")
+    def test_model_loaded_once(self, mock_whisper):
+        mock_info = MagicMock()
+        mock_info.language = "en"
+        mock_info.language_probability = 0.99
+        mock_whisper.return_value.transcribe.return_value = ([], mock_info)
+
+        params = {
+            "audio_file": self.audio_file,
+            "_workspace": self.workspace
+        }
+        execute(params)
+        execute(params)
+        mock_whisper.assert_called_once_with("base", device="cpu", compute_type="int8")
+
     def test_file_not_found(self):
         params = {
             "audio_file": "missing.ogg",
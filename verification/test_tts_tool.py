@@ -6,11 +6,12 @@ import sys
 # Add project root to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from tools.text_to_speech import execute, DEFAULT_MODEL_NAME
+from tools.text_to_speech import execute, DEFAULT_MODEL_NAME, _VOICE_CACHE
 
 class TestTextToSpeech(unittest.TestCase):
 
     def setUp(self):
+        _VOICE_CACHE.clear()
         self.workspace = "test_tts_workspace"
         if not os.path.exists(self.workspace):
             os.makedirs(self.workspace)
@@ -117,7 +118,25 @@ class TestTextToSpeech(unittest.TestCase):
         self.assertIn("Successfully generated speech audio", result)
         self.assertIn("Voice: en_US-lessac-medium", result)
 
-    @patch("tools.text_to_speech.requests.get")
+    @patch("tools.text_to_speech.PiperVoice")
+    @patch("tools.text_to_speech.download_file")
+    @patch("os.path.exists")
+    @patch("wave.open")
+    def test_tts_voice_loaded_once(self, mock_wave_open, mock_exists, mock_download, mock_piper_voice_tool):
+        mock_exists.return_value = True
+        mock_piper_voice_tool.load.return_value.synthesize.return_value = []
+
+        params = {
+            "text": "Hello world",
+            "output_file": "test.wav",
+            "_workspace": self.workspace
+        }
+
+        execute(params)
+        execute(params)
+        mock_piper_voice_tool.load.assert_called_once()
+
+    @patch("tools.text_to_speech._SESSION.get")
     def test_download_failed(self, mock_get):
         # Setup mock to raise error on download
         mock_get.side_effect = Exception("Connection error")
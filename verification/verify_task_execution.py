@@ -30,7 +30,7 @@ class MockChannel:
 
 # Mock Provider
 class MockProvider:
-    def generate_response(self, messages, tools=None):
+    def generate_response(self, messages, tools=None, background=False):
         last_msg = messages[-1]
         print(f"PROVIDER RECEIVED: {last_msg}")
         if last_msg["role"] == "user" and "Scheduled Task:" in last_msg["content"]: